@@ -0,0 +1,7 @@
+"""Reusable building blocks for the DengAI unsupervised-learning analysis.
+
+The notebook in ``dengue_group_aa.py`` walks through the analysis cell by
+cell; the modules in this package hold the same stages as plain functions so
+they can be run headless, on bigger feeds and from batch jobs. Submodules are
+imported on demand so importing the package itself stays cheap.
+"""
@@ -0,0 +1,5 @@
+import sys
+
+from dengue.cli import main
+
+sys.exit(main())
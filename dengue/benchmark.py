@@ -0,0 +1,209 @@
+"""Benchmark of the analysis stages on synthetic data of growing size.
+
+Every stage of the notebook (impute, filter, scale, PCA, k-distance, DBSCAN
+sweep, K-means sweep, linkage, profiling, the per-city driver) is timed on
+frames from ``dengue.synthetic`` of 10^3 to 10^6 rows, with the peak
+memory it allocates. Results are written as JSON so runs of different
+versions can be compared with ``compare_results``::
+
+    python -m dengue.benchmark --sizes 1000 10000 100000 --output bench.json
+    python -m dengue.benchmark --compare old.json bench.json
+
+Stages that grow quadratically are skipped above a row limit; skipped
+stages are recorded as such rather than left out.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from sklearn import preprocessing
+from sklearn.decomposition import PCA
+
+from dengue.cities import run_cities
+from dengue.filtering import filter_city_years, partition_by_city
+from dengue.hierarchy import linkage_from_features
+from dengue.imputation import impute
+from dengue.kmeans import kmeans_sweep
+from dengue.neighbors import k_distances
+from dengue.outliers import dbscan_sweep
+from dengue.profiling import profile_clusters
+from dengue.synthetic import synthetic_features
+
+SIZES = (1000, 10000, 100000, 1000000)
+
+STAGES = ('impute', 'filter', 'scale', 'pca', 'k_distance', 'dbscan_sweep',
+          'kmeans_sweep', 'linkage', 'profiling', 'cities')
+
+# Largest number of rows each stage is run with
+ROW_LIMITS = {
+  'dbscan_sweep': 200000,
+  'kmeans_sweep': 200000,
+  'linkage': 20000,
+}
+
+# Parameters of the notebook
+MIN_PTS = 6
+EPS_VALUES = np.arange(0.5, 0.8, 0.05)
+KS = range(2, 13)
+
+# Slowdown over the previous run reported as a regression
+TOLERANCE = 1.25
+
+
+def measure(func, *args, **kwargs):
+  """``(result, seconds, peak_bytes)`` of one call."""
+  tracemalloc.start()
+  start = time.perf_counter()
+  try:
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  return result, seconds, peak
+
+
+def _environment():
+  import pandas
+  import scipy
+  import sklearn
+  return {
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'numpy': np.__version__,
+    'pandas': pandas.__version__,
+    'scipy': scipy.__version__,
+    'sklearn': sklearn.__version__,
+  }
+
+
+def run_size(n_rows, impute_method='knn', row_limits=ROW_LIMITS,
+             stages=STAGES, random_state=0):
+  """Benchmark records of every stage on ``n_rows`` synthetic rows."""
+  records = []
+  state = {'raw': synthetic_features(n_rows, random_state=random_state)}
+
+  def record(stage, func, *args, **kwargs):
+    if stage not in stages:
+      return None
+    limit = row_limits.get(stage)
+    entry = {'rows': n_rows, 'stage': stage}
+    if limit is not None and n_rows > limit:
+      entry['skipped'] = 'more than %d rows' % limit
+      records.append(entry)
+      return None
+    result, seconds, peak = measure(func, *args, **kwargs)
+    entry.update(seconds=seconds, peak_bytes=peak)
+    records.append(entry)
+    return result
+
+  imputed = record('impute', impute, state['raw'], impute_method)
+  if imputed is None:
+    imputed = state['raw'].fillna(state['raw'].mean())
+
+  def filter_stage(df):
+    partition = partition_by_city(df)
+    selected = [partition.select(city, (1990, 1996))
+                for city in partition.cities]
+    selected.append(filter_city_years(df, 'sj', (1990, 1996)))
+    return selected
+  record('filter', filter_stage, imputed)
+
+  scaled = record('scale', preprocessing.MinMaxScaler().fit_transform, imputed)
+  if scaled is None:
+    scaled = preprocessing.MinMaxScaler().fit_transform(imputed)
+  projected = record('pca', PCA().fit_transform, scaled)
+  if projected is None:
+    projected = PCA(3).fit_transform(scaled)
+  projected = projected[:, :3]
+
+  record('k_distance', k_distances, scaled, MIN_PTS)
+  record('dbscan_sweep', dbscan_sweep, scaled, EPS_VALUES, MIN_PTS)
+  sweep = record('kmeans_sweep', kmeans_sweep, projected, KS,
+                 silhouette_sample=min(n_rows, 5000))
+  record('linkage', linkage_from_features, scaled, 'complete')
+  if sweep is not None:
+    labels = sweep.labels(3)
+  else:
+    labels = np.random.RandomState(random_state).randint(0, 3, n_rows)
+  record('profiling', profile_clusters, imputed, labels)
+  record('cities', run_cities, imputed, eps=0.65, min_samples=MIN_PTS)
+  return records
+
+
+def run_benchmark(sizes=SIZES, impute_method='knn', row_limits=ROW_LIMITS,
+                  stages=STAGES, random_state=0):
+  """Benchmark every size; returns the JSON-ready report."""
+  report = {
+    'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    'environment': _environment(),
+    'impute_method': impute_method,
+    'results': [],
+  }
+  for n_rows in sizes:
+    report['results'].extend(run_size(n_rows, impute_method, row_limits,
+                                      stages, random_state))
+  return report
+
+
+def compare_results(previous, current, tolerance=TOLERANCE):
+  """``[rows, stage, before, after, ratio]`` of the stages that slowed down."""
+  def timings(report):
+    return {(r['rows'], r['stage']): r['seconds']
+            for r in report['results'] if 'seconds' in r}
+  before, after = timings(previous), timings(current)
+  regressions = []
+  for key in sorted(set(before) & set(after)):
+    ratio = after[key] / before[key] if before[key] > 0 else float('inf')
+    if ratio > tolerance:
+      regressions.append([key[0], key[1], before[key], after[key], ratio])
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(
+      prog='python -m dengue.benchmark',
+      description='Time the analysis stages on synthetic DengAI-like data.')
+  parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+  parser.add_argument('--stages', nargs='+', choices=STAGES,
+                      default=list(STAGES))
+  parser.add_argument('--impute', default='knn', dest='impute_method')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--output', help='JSON file for the results')
+  parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                      help='report the stages of NEW slower than in OLD')
+  parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+  args = parser.parse_args(argv)
+
+  if args.compare:
+    with open(args.compare[0]) as fh:
+      previous = json.load(fh)
+    with open(args.compare[1]) as fh:
+      current = json.load(fh)
+    regressions = compare_results(previous, current, args.tolerance)
+    for rows, stage, before, after, ratio in regressions:
+      print('%8d %-14s %10.4fs -> %10.4fs  x%.2f'
+            % (rows, stage, before, after, ratio))
+    return 1 if regressions else 0
+
+  report = run_benchmark(args.sizes, args.impute_method, stages=args.stages,
+                         random_state=args.seed)
+  for r in report['results']:
+    if 'skipped' in r:
+      print('%8d %-14s skipped, %s' % (r['rows'], r['stage'], r['skipped']))
+    else:
+      print('%8d %-14s %10.4fs %12d bytes'
+            % (r['rows'], r['stage'], r['seconds'], r['peak_bytes']))
+  if args.output:
+    with open(args.output, 'w') as fh:
+      json.dump(report, fh, indent=2)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
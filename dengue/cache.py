@@ -0,0 +1,244 @@
+"""Content-addressed on-disk cache of stage results.
+
+``StageCache.run(name, func, *args, **kwargs)`` keys the result of a stage
+on a hash of the stage name, the function and every argument: arrays and
+frames by their contents, everything else by value. Functions count with
+the version of their code: the source files of their package, or the
+``__version__`` of an installed one, so editing ``dengue`` recomputes the
+stages instead of serving results of the old code. A key already on disk
+is loaded instead of recomputed, so changing a late parameter (the DBSCAN
+``eps``, the dendrogram cut, ``k``) leaves the imputation and the
+projections alone.
+
+Arrays are stored as ``.npy`` and reloaded memory-mapped, frames as
+Parquet, tuples and lists of them as one file per item, and any other
+result is pickled. Arrays come back as read-only memory maps, the same on
+the first run as on later ones; since they cannot change, the cache
+remembers their key and passing them on to the next stage does not hash
+them again. The directory is kept under ``max_bytes`` by evicting the
+least recently used entries.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import sys
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# Default size cap of the cache directory
+MAX_BYTES = 2 * 1024 ** 3
+
+# Code version of every package seen, computed once per process
+_CODE_VERSIONS = {}
+
+
+def _package_version(package):
+  module = sys.modules.get(package)
+  if module is None:
+    return ''
+  version = getattr(module, '__version__', None)
+  if version is not None:
+    return str(version)
+  # A package without a version, such as this one: hash its source files
+  paths = list(getattr(module, '__path__', []))
+  files = []
+  if not paths and getattr(module, '__file__', None):
+    files.append(module.__file__)
+  for root in paths:
+    for folder, dirs, names in os.walk(root):
+      dirs.sort()
+      files.extend(os.path.join(folder, name) for name in sorted(names)
+                   if name.endswith('.py'))
+  digest = hashlib.blake2b(digest_size=20)
+  for path in files:
+    with open(path, 'rb') as fh:
+      digest.update(fh.read())
+  return digest.hexdigest()
+
+
+def _code_version(func):
+  # Changes whenever the code that func runs may have changed
+  module = getattr(func, '__module__', None) or ''
+  if module == '__main__':
+    # A notebook or script: only the function itself, not every cell
+    try:
+      return inspect.getsource(func)
+    except (OSError, TypeError):
+      return ''
+  package = module.partition('.')[0]
+  if package not in _CODE_VERSIONS:
+    _CODE_VERSIONS[package] = _package_version(package)
+  return _CODE_VERSIONS[package]
+
+
+def _update(digest, obj, known):
+  # Feed a stable description of obj into the hash
+  key = known(obj)
+  if key is not None:
+    digest.update(b'key:' + key.encode())
+  elif isinstance(obj, np.ndarray):
+    digest.update(('ndarray:%s:%s' % (obj.dtype.str, obj.shape)).encode())
+    digest.update(memoryview(np.ascontiguousarray(obj)).cast('B'))
+  elif isinstance(obj, (pd.DataFrame, pd.Series)):
+    digest.update(('%s:%s' % (type(obj).__name__, obj.shape)).encode())
+    if isinstance(obj, pd.DataFrame):
+      digest.update(repr((list(obj.columns), list(map(str, obj.dtypes)))).encode())
+    digest.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+  elif isinstance(obj, dict):
+    digest.update(b'dict')
+    for k in sorted(obj, key=repr):
+      _update(digest, k, known)
+      _update(digest, obj[k], known)
+  elif isinstance(obj, (list, tuple)):
+    digest.update(('%s:%d' % (type(obj).__name__, len(obj))).encode())
+    for item in obj:
+      _update(digest, item, known)
+  elif callable(obj) and hasattr(obj, '__qualname__'):
+    digest.update(('callable:%s.%s' % (obj.__module__, obj.__qualname__)).encode())
+    digest.update(_code_version(obj).encode())
+  elif isinstance(obj, np.generic):
+    digest.update(repr(obj.item()).encode())
+  else:
+    digest.update(('%s:%r' % (type(obj).__name__, obj)).encode())
+
+
+class StageCache:
+  """Stage results on disk, keyed by the content of their inputs."""
+
+  def __init__(self, directory, max_bytes=MAX_BYTES, mmap=True):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.mmap = mmap
+    self.hits = 0
+    self.misses = 0
+    self._keys = {}
+    os.makedirs(directory, exist_ok=True)
+
+  def _known(self, obj):
+    entry = self._keys.get(id(obj))
+    if entry is not None and entry[0]() is obj:
+      return entry[1]
+    return None
+
+  def _remember(self, obj, key):
+    # Only read-only arrays, anything else may be modified after the fact
+    if isinstance(obj, np.ndarray) and not obj.flags.writeable:
+      # A weak reference, so remembering a result does not keep it alive
+      self._keys[id(obj)] = (weakref.ref(obj), key)
+    if isinstance(obj, (list, tuple)):
+      for i, item in enumerate(obj):
+        self._remember(item, '%s/%d' % (key, i))
+
+  def key(self, name, func, args, kwargs):
+    digest = hashlib.blake2b(digest_size=20)
+    _update(digest, (name, func, list(args), kwargs), self._known)
+    return digest.hexdigest()
+
+  def _path(self, key):
+    return os.path.join(self.directory, key)
+
+  def _store(self, path, result):
+    if isinstance(result, np.ndarray) and result.dtype != object:
+      np.save(path + '.npy', result)
+      return {'kind': 'npy'}
+    if isinstance(result, pd.DataFrame):
+      try:
+        result.to_parquet(path + '.parquet')
+        return {'kind': 'parquet'}
+      except ImportError:
+        pass
+    if isinstance(result, (list, tuple)) and result:
+      os.makedirs(path, exist_ok=True)
+      items = [self._store(os.path.join(path, str(i)), item)
+               for i, item in enumerate(result)]
+      return {'kind': type(result).__name__, 'items': items}
+    with open(path + '.pkl', 'wb') as fh:
+      pickle.dump(result, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    return {'kind': 'pickle'}
+
+  def _load(self, path, meta):
+    kind = meta['kind']
+    if kind == 'npy':
+      return np.load(path + '.npy', mmap_mode='r' if self.mmap else None)
+    if kind == 'parquet':
+      return pd.read_parquet(path + '.parquet')
+    if kind in ('list', 'tuple'):
+      items = [self._load(os.path.join(path, str(i)), item)
+               for i, item in enumerate(meta['items'])]
+      return tuple(items) if kind == 'tuple' else items
+    with open(path + '.pkl', 'rb') as fh:
+      return pickle.load(fh)
+
+  def _entries(self):
+    for name in os.listdir(self.directory):
+      if name.endswith('.json'):
+        yield name[:-len('.json')]
+
+  def _entry_bytes(self, key):
+    total = 0
+    for name in os.listdir(self.directory):
+      if name == key or name.startswith(key + '.'):
+        path = os.path.join(self.directory, name)
+        if os.path.isdir(path):
+          for root, _, files in os.walk(path):
+            total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        else:
+          total += os.path.getsize(path)
+    return total
+
+  def evict(self, key):
+    for name in os.listdir(self.directory):
+      if name == key or name.startswith(key + '.'):
+        path = os.path.join(self.directory, name)
+        if os.path.isdir(path):
+          shutil.rmtree(path)
+        else:
+          os.remove(path)
+
+  def prune(self):
+    """Evict least recently used entries until under ``max_bytes``."""
+    entries = []
+    for key in self._entries():
+      meta = self._path(key) + '.json'
+      entries.append((os.path.getmtime(meta), key, self._entry_bytes(key)))
+    total = sum(size for _, _, size in entries)
+    for _, key, size in sorted(entries):
+      if total <= self.max_bytes:
+        break
+      self.evict(key)
+      total -= size
+
+  def run(self, name, func, *args, **kwargs):
+    """Result of ``func(*args, **kwargs)``, from disk when already known."""
+    key = self.key(name, func, args, kwargs)
+    path = self._path(key)
+    meta_path = path + '.json'
+    if os.path.exists(meta_path):
+      with open(meta_path) as fh:
+        meta = json.load(fh)
+      # Touching the entry marks it as recently used
+      os.utime(meta_path)
+      result = self._load(path, meta['result'])
+      self.hits += 1
+    else:
+      result = func(*args, **kwargs)
+      meta = {'stage': name, 'result': self._store(path, result)}
+      with open(meta_path, 'w') as fh:
+        json.dump(meta, fh)
+      self.misses += 1
+      if self.mmap and meta['result']['kind'] in ('npy', 'list', 'tuple'):
+        result = self._load(path, meta['result'])
+      self.prune()
+    self._remember(result, key)
+    return result
+
+  def clear(self):
+    for key in list(self._entries()):
+      self.evict(key)
+    self._keys.clear()
@@ -0,0 +1,176 @@
+"""The analysis of every city, or city and year window, in a process pool.
+
+The notebook analyzes ``train.loc['sj']`` only; covering Iquitos and any
+other region meant running it again per city. ``run_cities`` splits the
+imputed frame with ``CityPartition``, copies its features once into a
+``multiprocessing.shared_memory`` block that the workers map instead of
+receiving a pickled copy, and runs filter -> scale -> PCA -> DBSCAN
+outliers -> K-means for every city (or city and window) in parallel. Each
+task only ships the positions of its rows; the labels and the time spent in
+every stage come back into one report.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from sklearn import preprocessing
+from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA
+
+from dengue.features import DATE_COLUMN
+from dengue.filtering import CityPartition, year_windows
+from dengue.outliers import DBSCANSweep
+from dengue.trace import traced
+
+STAGES = ['filter', 'scale', 'pca', 'outliers', 'cluster']
+
+# Seconds spent in every stage, named apart from the outlier count
+REPORT_HEADERS = (['city', 'first', 'last', 'weeks', 'outliers', 'groups']
+                  + ['%s_s' % name for name in STAGES] + ['seconds'])
+
+_worker_X = None
+_worker_memory = None
+
+
+def _init_worker(name, shape, dtype):
+  # Map the shared block once per worker, it stays open for every task
+  global _worker_X, _worker_memory
+  _worker_memory = shared_memory.SharedMemory(name=name)
+  _worker_X = np.ndarray(shape, dtype=dtype, buffer=_worker_memory.buf)
+
+
+def _init_local(X):
+  global _worker_X
+  _worker_X = X
+
+
+def _analyze(positions, n_components=3, eps=None, min_samples=6, k=3,
+             drop_outliers=False, random_state=0):
+  timings = {}
+  clock = time.perf_counter()
+
+  def lap(name):
+    nonlocal clock
+    now = time.perf_counter()
+    timings[name] = now - clock
+    clock = now
+
+  X = _worker_X[positions]
+  lap('filter')
+  scaled = preprocessing.MinMaxScaler().fit_transform(X)
+  lap('scale')
+  pca = PCA(n_components=n_components).fit(scaled)
+  projected = pca.transform(scaled)
+  lap('pca')
+  outlier = np.zeros(len(X), dtype=bool)
+  if eps is not None:
+    outlier = DBSCANSweep(scaled, eps, min_samples=min_samples).labels(eps) == -1
+  keep = ~outlier if drop_outliers else np.ones(len(X), dtype=bool)
+  points = projected[keep]
+  if drop_outliers and outlier.any() and keep.sum() >= max(k, n_components):
+    # As in the notebook, the projection is refitted without the outliers
+    scaled = preprocessing.MinMaxScaler().fit_transform(X[keep])
+    points = PCA(n_components=n_components).fit_transform(scaled)
+  lap('outliers')
+  groups = np.full(len(X), -1, dtype=np.intp)
+  if keep.sum() >= k:
+    km = KMeans(k, init='random', n_init=10, max_iter=300, tol=1e-04,
+                random_state=random_state)
+    groups[keep] = km.fit_predict(points[:, :n_components])
+  lap('cluster')
+  return groups, outlier, timings
+
+
+def _run_task(args):
+  positions, params = args
+  return _analyze(positions, **params)
+
+
+def city_tasks(partition, years=None, width=None, step=None):
+  """``((city, first, last), positions)`` of every city or city and window.
+
+  Positions index the rows of ``partition.frame``. Without ``width`` every
+  city is one task, over ``years`` or its whole history; with it the years
+  are cut into windows of ``width`` years every ``step`` years.
+  """
+  all_years = np.asarray(partition.frame.index.get_level_values('year'))
+  tasks = []
+  for city, rows in partition.slices.items():
+    city_years = all_years[rows]
+    first, last = (city_years.min(), city_years.max()) if years is None else years
+    windows = ([(first, last)] if width is None
+               else year_windows(first, last, width, step))
+    for window in windows:
+      inside = (city_years >= window[0]) & (city_years <= window[1])
+      positions = rows.start + np.flatnonzero(inside)
+      if len(positions):
+        tasks.append(((city, int(window[0]), int(window[1])), positions))
+  return tasks
+
+
+@traced('cities')
+def run_cities(df, years=None, width=None, step=None, n_jobs=None,
+               n_components=3, eps=None, min_samples=6, k=3,
+               drop_outliers=False, random_state=0):
+  """``(report, labels)`` of the analysis of every city or city and window.
+
+  ``df`` is the imputed frame indexed by city, week and year. ``report``
+  holds one ``REPORT_HEADERS`` row per task, with the seconds spent in
+  every stage; ``labels`` maps ``(city, first, last)`` to a frame of the
+  ``group`` (-1 for dropped outliers) and ``outlier`` flag of its weeks.
+  Tasks with fewer weeks than ``k`` or ``n_components`` are not run: their
+  report row only has the number of weeks, and they have no labels.
+  ``n_jobs=1`` runs the tasks in this process.
+  """
+  if DATE_COLUMN in df.columns:
+    df = df.drop(columns=DATE_COLUMN)
+  partition = CityPartition(df)
+  tasks = city_tasks(partition, years, width, step)
+  # Tasks with too few weeks to project and cluster are only reported
+  runs = [len(positions) >= max(k, n_components) for _, positions in tasks]
+  X = np.ascontiguousarray(partition.frame.to_numpy(dtype=np.float64))
+  params = dict(n_components=n_components, eps=eps, min_samples=min_samples,
+                k=k, drop_outliers=drop_outliers, random_state=random_state)
+  work = [(positions, params) for (_, positions), run in zip(tasks, runs)
+          if run]
+
+  if not work:
+    results = []
+  elif n_jobs == 1:
+    _init_local(X)
+    results = [_run_task(args) for args in work]
+    _init_local(None)
+  else:
+    memory = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+    try:
+      np.ndarray(X.shape, dtype=X.dtype, buffer=memory.buf)[:] = X
+      n_jobs = min(n_jobs or os.cpu_count() or 1, len(work))
+      with ProcessPoolExecutor(n_jobs, initializer=_init_worker,
+                               initargs=(memory.name, X.shape, X.dtype)) as pool:
+        results = list(pool.map(_run_task, work))
+    finally:
+      memory.close()
+      memory.unlink()
+
+  report = []
+  labels = {}
+  results = iter(results)
+  for (key, positions), run in zip(tasks, runs):
+    if not run:
+      report.append(list(key) + [len(positions)]
+                    + [None] * (len(REPORT_HEADERS) - len(key) - 1))
+      continue
+    groups, outlier, timings = next(results)
+    index = partition.frame.index[positions].droplevel('city')
+    labels[key] = pd.DataFrame({'group': groups, 'outlier': outlier},
+                               index=index)
+    found = groups[groups >= 0]
+    report.append(list(key) + [len(positions), int(outlier.sum()),
+                               len(np.unique(found))]
+                  + [timings[name] for name in STAGES]
+                  + [sum(timings.values())])
+  return report, labels
@@ -0,0 +1,174 @@
+"""Command line entry point for batch runs of the analysis.
+
+    python -m dengue run dengue_features_train.csv --city sj --years 1990-1996 --k 3
+
+loads the features, imputes, filters, scales and projects them, optionally
+drops the DBSCAN outliers, clusters the weeks and writes one label per week
+as CSV. Only the standard library is imported at startup; numpy, pandas and
+scikit-learn are imported when the run starts, and plotly or Colab only when
+plots or an upload are requested, so the command stays cheap to call from a
+scheduler for every new batch.
+"""
+
+import argparse
+import sys
+import time
+
+_STARTED = time.perf_counter()
+
+
+def _years(text):
+  first, _, last = text.partition('-')
+  try:
+    return int(first), int(last or first)
+  except ValueError:
+    raise argparse.ArgumentTypeError('expected YEAR or FIRST-LAST, got %r'
+                                     % (text,))
+
+
+def _log(args, message, *values):
+  if args.verbose:
+    print('[%7.3fs] %s' % (time.perf_counter() - _STARTED, message % values),
+          file=sys.stderr)
+
+
+def _load(args):
+  if args.source is None:
+    # Only inside Colab
+    import io
+    from google.colab import files
+    uploaded = files.upload()
+    name = next(iter(uploaded))
+    source = io.BytesIO(uploaded[name])
+  else:
+    source = args.source
+  from dengue.loading import read_train_features
+  return read_train_features(source, cache=args.cache)
+
+
+def _cluster(args, scaled, projected):
+  import numpy as np
+  if args.method == 'kmeans':
+    from sklearn.cluster import KMeans
+    km = KMeans(args.k, init='random', n_init=10, max_iter=300, tol=1e-04,
+                random_state=args.seed)
+    return km.fit_predict(projected[:, :args.components])
+  from scipy.cluster.hierarchy import fcluster
+  from dengue.hierarchy import linkage_from_features
+  clusters = linkage_from_features(scaled, method=args.linkage)
+  return np.asarray(fcluster(clusters, args.k, criterion='maxclust'))
+
+
+def run(args):
+  if args.trace:
+    from dengue import trace
+    trace.enable(args.trace)
+  _log(args, 'started')
+  import numpy as np
+  import pandas as pd
+  from dengue.pipeline import DenguePipeline
+  _log(args, 'libraries imported')
+
+  raw = _load(args)
+  _log(args, 'loaded %d records', len(raw))
+  pipeline = DenguePipeline(city=args.city, years=args.years,
+                            impute_method=args.impute,
+                            n_components=args.components,
+                            by_city=args.by_city)
+  if args.stage_cache:
+    from dengue.cache import StageCache
+    from dengue.pipeline import prepare_features
+    features = StageCache(args.stage_cache).run(
+        'prepare', prepare_features, raw, args.city, args.years, args.impute,
+        by_city=args.by_city)
+  else:
+    features = pipeline.prepare(raw)
+  if len(features) == 0:
+    print('no records for city %r in %d-%d' % ((args.city,) + args.years),
+          file=sys.stderr)
+    return 1
+  pipeline.fit_features(features)
+  scaled, projected = pipeline.transform_features(features)
+  _log(args, 'prepared %d weeks', len(features))
+
+  outlier = np.zeros(len(features), dtype=bool)
+  if args.eps is not None:
+    from dengue.outliers import DBSCANSweep
+    dbscan = DBSCANSweep(scaled, args.eps, min_samples=args.min_samples)
+    outlier = dbscan.labels(args.eps) == -1
+    _log(args, '%d outliers', outlier.sum())
+    if args.save_outliers:
+      dbscan.outlier_model(args.eps).save(args.save_outliers)
+    if args.drop_outliers and outlier.any():
+      features = features[~outlier]
+      pipeline.fit_features(features)
+      scaled, projected = pipeline.transform_features(features)
+      outlier = outlier[~outlier]
+
+  labels = _cluster(args, scaled, projected)
+  _log(args, 'clustered into %d groups', len(np.unique(labels)))
+  result = pd.DataFrame({'group': labels}, index=features.index)
+  if args.eps is not None and not args.drop_outliers:
+    result['outlier'] = outlier
+  result.to_csv(args.output if args.output else sys.stdout)
+
+  if args.save_pipeline:
+    pipeline.save(args.save_pipeline)
+  if args.plots:
+    from dengue.plots import PointCloud, export_figures
+    cloud = PointCloud(projected)
+    export_figures({'clusters': cloud.scatter(color=labels,
+                                              title='Clusters of %s' % args.city)},
+                   args.plots)
+    _log(args, 'plots written to %s', args.plots)
+  _log(args, 'done')
+  return 0
+
+
+def build_parser():
+  parser = argparse.ArgumentParser(
+      prog='python -m dengue',
+      description='Unsupervised analysis of the DengAI weekly features.')
+  commands = parser.add_subparsers(dest='command', required=True)
+
+  cmd = commands.add_parser('run', help='label the weeks of one city')
+  cmd.add_argument('source', nargs='?',
+                   help='features CSV; upload it through Colab if omitted')
+  cmd.add_argument('--cache', help='.parquet or .npz cache of the parsed CSV')
+  cmd.add_argument('--stage-cache', metavar='DIR',
+                   help='reuse the imputed, filtered weeks of earlier runs')
+  cmd.add_argument('--city', default='sj')
+  cmd.add_argument('--years', type=_years, default=(1990, 1996),
+                   help='FIRST-LAST, inclusive (default 1990-1996)')
+  cmd.add_argument('--impute', default='knn_exact',
+                   choices=('interpolate', 'ffill', 'knn', 'knn_exact'))
+  cmd.add_argument('--by-city', action='store_true',
+                   help='impute every city from its own weeks only')
+  cmd.add_argument('--components', type=int, default=3,
+                   help='PCA components used for K-means (default 3)')
+  cmd.add_argument('--eps', type=float,
+                   help='flag DBSCAN outliers with this eps')
+  cmd.add_argument('--min-samples', type=int, default=6)
+  cmd.add_argument('--drop-outliers', action='store_true',
+                   help='cluster without the DBSCAN outliers')
+  cmd.add_argument('--save-outliers',
+                   help='pickle the outlier model of the scaled weeks')
+  cmd.add_argument('--method', default='kmeans',
+                   choices=('kmeans', 'hierarchical'))
+  cmd.add_argument('--linkage', default='complete',
+                   help='linkage criterion of the hierarchical method')
+  cmd.add_argument('--k', type=int, default=3, help='number of groups')
+  cmd.add_argument('--seed', type=int, default=0)
+  cmd.add_argument('--output', '-o', help='labels CSV (default stdout)')
+  cmd.add_argument('--save-pipeline', help='pickle the fitted preprocessing')
+  cmd.add_argument('--plots', help='directory for HTML plots')
+  cmd.add_argument('--trace', help='write a stage trace (.json or .jsonl)')
+  cmd.add_argument('--verbose', '-v', action='store_true',
+                   help='log the progress and timings to stderr')
+  cmd.set_defaults(func=run)
+  return parser
+
+
+def main(argv=None):
+  args = build_parser().parse_args(argv)
+  return args.func(args)
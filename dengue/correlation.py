@@ -0,0 +1,148 @@
+"""Feature correlations from running sums, updated week by week.
+
+The notebook transposed the filtered frame to feed ``corrcoef`` and read the
+groups of redundant features off the heatmap. ``RunningCorrelation`` works
+on the rows as they are and keeps the count, the means and the co-moment
+matrix of the weeks seen, merged in the stable form of Welford and Chan:
+adding or removing a batch of m weeks costs O(m d^2), whatever the number
+of weeks already summarized. ``rolling_correlations`` slides year windows
+over every city with it, adding the year that enters and removing the one
+that leaves, and ``redundancy_groups`` lists the features whose absolute
+correlation is above a threshold.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from dengue.filtering import CityPartition, year_windows
+from dengue.trace import traced
+
+
+class RunningCorrelation:
+  """Count, means and co-moments of the rows added and not removed."""
+
+  def __init__(self, n_features):
+    self.n = 0
+    self.mean = np.zeros(n_features)
+    self.comoment = np.zeros((n_features, n_features))
+
+  @staticmethod
+  def _summary(X):
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    mean = X.mean(axis=0)
+    centered = X - mean
+    return len(X), mean, centered.T @ centered
+
+  def add(self, X):
+    """Add the rows of ``X``."""
+    m, mean, comoment = self._summary(X)
+    if m == 0:
+      return self
+    n = self.n + m
+    delta = mean - self.mean
+    self.mean = self.mean + delta * (m / n)
+    self.comoment += comoment + np.outer(delta, delta) * (self.n * m / n)
+    self.n = n
+    return self
+
+  def remove(self, X):
+    """Remove rows of ``X`` previously added."""
+    m, mean, comoment = self._summary(X)
+    if m == 0:
+      return self
+    if m > self.n:
+      raise ValueError('removing %d rows from %d' % (m, self.n))
+    n = self.n - m
+    if n == 0:
+      self.n = 0
+      self.mean[:] = 0
+      self.comoment[:] = 0
+      return self
+    rest = (self.mean * self.n - mean * m) / n
+    delta = mean - rest
+    self.comoment -= comoment + np.outer(delta, delta) * (n * m / self.n)
+    self.mean = rest
+    self.n = n
+    return self
+
+  def covariance(self, ddof=1):
+    return self.comoment / (self.n - ddof)
+
+  def correlation(self):
+    """Pearson correlation matrix, NaN for the constant features."""
+    scale = np.sqrt(np.clip(np.diag(self.comoment), 0, None))
+    with np.errstate(invalid='ignore', divide='ignore'):
+      corr = self.comoment / np.outer(scale, scale)
+    return np.clip(corr, -1, 1)
+
+
+def correlation_frame(df):
+  """Correlation of the columns of ``df`` as a labelled frame."""
+  running = RunningCorrelation(df.shape[1]).add(df.to_numpy())
+  return pd.DataFrame(running.correlation(), index=df.columns,
+                      columns=df.columns)
+
+
+def _year_slices(df):
+  # Rows of df sorted by year, and the slice of every year
+  years = np.asarray(df.index.get_level_values('year'))
+  order = np.argsort(years, kind='stable')
+  values = df.to_numpy(dtype=np.float64)[order]
+  found, starts = np.unique(years[order], return_index=True)
+  stops = np.append(starts[1:], len(order))
+  return values, {int(year): slice(start, stop)
+                  for year, start, stop in zip(found, starts, stops)}
+
+
+@traced('correlation')
+def rolling_correlations(df, width, step=1, years=None):
+  """``(city, first, last) -> correlation frame`` over sliding year windows.
+
+  Windows of ``width`` years start every ``step`` years, over ``years`` or
+  the history of each city; no window shorter than ``width`` is made at
+  the end. From one window to the next only the years that leave and
+  enter it are removed and added. Without a city level in the index the
+  whole frame is one city, ``None``.
+  """
+  if 'city' in df.index.names:
+    groups = CityPartition(df).items()
+  else:
+    groups = [(None, df)]
+  columns = df.columns
+  result = {}
+  for city, records in groups:
+    values, rows = _year_slices(records)
+    if not rows:
+      continue
+    first, last = (min(rows), max(rows)) if years is None else years
+    running = RunningCorrelation(len(columns))
+    current = set()
+    for window in year_windows(first, last, width, step, full=True):
+      wanted = set(range(window[0], window[1] + 1)) & set(rows)
+      for year in sorted(current - wanted):
+        running.remove(values[rows[year]])
+      for year in sorted(wanted - current):
+        running.add(values[rows[year]])
+      current = wanted
+      if running.n > 1:
+        result[(city,) + window] = pd.DataFrame(running.correlation(),
+                                                index=columns, columns=columns)
+  return result
+
+
+def redundancy_groups(corr, threshold=0.8):
+  """Groups of features linked by an absolute correlation above ``threshold``.
+
+  Features are grouped when a chain of such correlations joins them; the
+  groups of more than one feature are returned, largest first.
+  """
+  names = list(corr.columns)
+  strong = np.abs(np.nan_to_num(np.asarray(corr))) >= threshold
+  _, component = connected_components(sparse.csr_matrix(strong),
+                                      directed=False)
+  groups = [[names[i] for i in np.flatnonzero(component == c)]
+            for c in np.unique(component)]
+  groups = [group for group in groups if len(group) > 1]
+  return sorted(groups, key=len, reverse=True)
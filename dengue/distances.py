@@ -0,0 +1,142 @@
+"""Blocked, memory-bounded pairwise distances.
+
+The notebook built the full float64 distance matrix with
+``DistanceMetric.pairwise`` twice, about 3.2 GB per copy at 20k weeks.
+``DistanceStore`` computes the matrix in row blocks, optionally as float32
+and into a ``numpy.memmap`` on disk, and serves the consumers of the
+notebook from there one block at a time: k nearest neighbours, the
+condensed vector for linkage and a tiled image for the heatmap.
+"""
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from dengue.trace import traced
+
+# Rows of the distance matrix computed at a time
+BLOCK_ROWS = 1024
+
+# Side of the heatmap image, in tiles
+HEATMAP_SIZE = 512
+
+
+def pairwise_blocks(X, Y=None, metric='euclidean', block_rows=BLOCK_ROWS):
+  """Yield ``(start, stop, block)`` row blocks of the distances X to Y."""
+  X = np.asarray(X)
+  Y = X if Y is None else np.asarray(Y)
+  for start in range(0, len(X), block_rows):
+    stop = min(start + block_rows, len(X))
+    yield start, stop, cdist(X[start:stop], Y, metric=metric)
+
+
+def _tile_bounds(n, size):
+  # Start of every tile along one axis of the n x n matrix
+  return np.linspace(0, n, size + 1).astype(np.intp)
+
+
+class DistanceStore:
+  """Square distance matrix of ``X``, in memory or in a memmap file."""
+
+  @traced('distances')
+  def __init__(self, X, metric='euclidean', dtype=np.float64, path=None,
+               block_rows=BLOCK_ROWS):
+    X = np.asarray(X)
+    n = len(X)
+    self.n = n
+    self.block_rows = block_rows
+    if path is None:
+      self.matrix = np.empty((n, n), dtype=dtype)
+    else:
+      self.matrix = np.memmap(path, dtype=dtype, mode='w+', shape=(n, n))
+    for start, stop, block in pairwise_blocks(X, metric=metric,
+                                              block_rows=block_rows):
+      self.matrix[start:stop] = block
+    if path is not None:
+      self.matrix.flush()
+
+  @classmethod
+  def open(cls, path, n, dtype=np.float64, block_rows=BLOCK_ROWS):
+    """Reuse a matrix previously written to ``path``."""
+    store = cls.__new__(cls)
+    store.n = n
+    store.block_rows = block_rows
+    store.matrix = np.memmap(path, dtype=dtype, mode='r', shape=(n, n))
+    return store
+
+  @property
+  def nbytes(self):
+    return self.matrix.nbytes
+
+  def blocks(self):
+    """Yield ``(start, stop, block)`` row blocks of the stored matrix."""
+    for start in range(0, self.n, self.block_rows):
+      stop = min(start + self.block_rows, self.n)
+      yield start, stop, np.asarray(self.matrix[start:stop])
+
+  def kneighbors(self, k):
+    """``(distances, indices)`` of the k nearest neighbours of every point.
+
+    The point itself is left out, as in ``NearestNeighbors.kneighbors()``.
+    """
+    distances = np.empty((self.n, k), dtype=self.matrix.dtype)
+    indices = np.empty((self.n, k), dtype=np.intp)
+    for start, stop, block in self.blocks():
+      block = block.copy()
+      rows = np.arange(stop - start)
+      block[rows, rows + start] = np.inf
+      nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+      nearest_distances = np.take_along_axis(block, nearest, axis=1)
+      order = np.argsort(nearest_distances, axis=1, kind='stable')
+      indices[start:stop] = np.take_along_axis(nearest, order, axis=1)
+      distances[start:stop] = np.take_along_axis(nearest_distances, order,
+                                                 axis=1)
+    return distances, indices
+
+  def k_distances(self, k):
+    """Sorted distances from each point to its k-th nearest neighbour."""
+    distances, _ = self.kneighbors(k)
+    return np.sort(distances[:, -1])
+
+  def condensed(self, dtype=None, path=None):
+    """Upper triangle as the condensed vector ``linkage`` expects."""
+    n = self.n
+    dtype = self.matrix.dtype if dtype is None else dtype
+    size = n * (n - 1) // 2
+    if path is None:
+      out = np.empty(size, dtype=dtype)
+    else:
+      out = np.memmap(path, dtype=dtype, mode='w+', shape=(size,))
+    for start, stop, block in self.blocks():
+      for i in range(start, stop):
+        offset = i * n - i * (i + 1) // 2
+        out[offset:offset + n - i - 1] = block[i - start, i + 1:]
+    if path is not None:
+      out.flush()
+    return out
+
+  def heatmap(self, size=HEATMAP_SIZE, order=None):
+    """Image of the matrix with at most ``size`` x ``size`` tiles.
+
+    Each tile holds the mean distance of the cells it covers; below
+    ``size`` points the matrix is returned as is. ``order`` permutes rows
+    and columns first, e.g. to sort the points by cluster.
+    """
+    n = self.n
+    if n <= size:
+      image = np.asarray(self.matrix)
+      if order is not None:
+        image = image[np.ix_(order, order)]
+      return image
+    bounds = _tile_bounds(n, size)
+    # Tile of every point once rows are put in order
+    position = np.empty(n, dtype=np.intp)
+    position[np.arange(n) if order is None else order] = np.arange(n)
+    tile = np.searchsorted(bounds, position, side='right') - 1
+    sums = np.zeros((size, size))
+    for start, stop, block in self.blocks():
+      if order is not None:
+        block = block[:, order]
+      by_column = np.add.reduceat(block, bounds[:-1], axis=1, dtype=float)
+      np.add.at(sums, tile[start:stop], by_column)
+    counts = np.diff(bounds)
+    return sums / np.outer(counts, counts)
@@ -0,0 +1,42 @@
+"""Column layout of the DengAI weekly climate features."""
+
+# Fields that identify a weekly record
+INDEX_FIELDS = ['city', 'weekofyear', 'year']
+
+# Climate features as they come in dengue_features_train
+FEATURE_COLUMNS = [
+  'ndvi_ne', 'ndvi_nw', 'ndvi_se', 'ndvi_sw',
+  'precipitation_amt_mm',
+  'reanalysis_air_temp_k', 'reanalysis_avg_temp_k',
+  'reanalysis_dew_point_temp_k', 'reanalysis_max_air_temp_k',
+  'reanalysis_min_air_temp_k', 'reanalysis_precip_amt_kg_per_m2',
+  'reanalysis_relative_humidity_percent', 'reanalysis_sat_precip_amt_mm',
+  'reanalysis_specific_humidity_g_per_kg', 'reanalysis_tdtr_k',
+  'station_avg_temp_c', 'station_diur_temp_rng_c', 'station_max_temp_c',
+  'station_min_temp_c', 'station_precip_mm',
+]
+
+# Column we do not use for the analysis
+DATE_COLUMN = 'week_start_date'
+
+# Groups of related features the clusters are described by
+FEATURE_FAMILIES = {
+  'ndvi': ['ndvi_ne', 'ndvi_nw', 'ndvi_se', 'ndvi_sw'],
+  'precipitation': [
+    'station_precip_mm', 'precipitation_amt_mm',
+    'reanalysis_precip_amt_kg_per_m2', 'reanalysis_sat_precip_amt_mm',
+  ],
+  'station_temperature': [
+    'station_avg_temp_c', 'station_max_temp_c', 'station_min_temp_c',
+  ],
+  'reanalysis_temperature': [
+    'reanalysis_air_temp_k', 'reanalysis_avg_temp_k',
+    'reanalysis_dew_point_temp_k', 'reanalysis_max_air_temp_k',
+    'reanalysis_min_air_temp_k',
+  ],
+  'humidity': [
+    'reanalysis_relative_humidity_percent',
+    'reanalysis_specific_humidity_g_per_kg',
+  ],
+  'tdtr': ['reanalysis_tdtr_k', 'station_diur_temp_rng_c'],
+}
@@ -0,0 +1,115 @@
+"""City and year selection on the ``city/weekofyear/year`` index.
+
+Selections are answered with vectorised masks over the index levels instead
+of walking the rows in Python. ``partition_by_city`` groups the rows by city
+once, with a stable sort so the weekly order inside each city is kept, and
+then hands out per-city positional slices without any further sorting.
+"""
+
+import numpy as np
+
+from dengue.trace import traced
+
+
+def year_mask(index, years):
+  """Boolean mask of the rows whose ``year`` lies in ``(first, last)``."""
+  first, last = years
+  year = np.asarray(index.get_level_values('year'))
+  return (year >= first) & (year <= last)
+
+
+def city_mask(index, cities):
+  """Boolean mask of the rows whose ``city`` is one of ``cities``."""
+  if isinstance(cities, str):
+    cities = [cities]
+  return np.asarray(index.get_level_values('city').isin(list(cities)))
+
+
+@traced('filter')
+def select_records(df, cities=None, years=None):
+  """Rows of ``df`` for the given cities and inclusive year range."""
+  mask = np.ones(len(df), dtype=bool)
+  if cities is not None:
+    mask &= city_mask(df.index, cities)
+  if years is not None:
+    mask &= year_mask(df.index, years)
+  if mask.all():
+    return df
+  return df[mask]
+
+
+@traced('filter')
+def filter_city_years(df, city, years):
+  """Records of one city within a year range, without the city level.
+
+  Same rows, in the same order, as ``df.loc[city]`` filtered by year.
+  """
+  level = df.index.names.index('city')
+  positions = np.flatnonzero(df.index.codes[level]
+                             == df.index.levels[level].get_loc(city))
+  if len(positions) and positions[-1] - positions[0] + 1 == len(positions):
+    # Contiguous block, slice instead of gathering
+    records = df.iloc[positions[0]:positions[-1] + 1]
+  else:
+    records = df.iloc[positions]
+  records = records.droplevel('city')
+  if years is None:
+    return records
+  return records[year_mask(records.index, years)]
+
+
+class CityPartition:
+  """Frame grouped by city once, for repeated per-city selections."""
+
+  def __init__(self, df):
+    level = df.index.names.index('city')
+    codes = np.asarray(df.index.codes[level])
+    if len(codes) and not (np.diff(codes) >= 0).all():
+      order = np.argsort(codes, kind='stable')
+      df = df.iloc[order]
+      codes = codes[order]
+    cities = df.index.levels[level]
+    bounds = np.searchsorted(codes, np.arange(len(cities) + 1))
+    self.frame = df
+    self.slices = {
+      cities[i]: slice(bounds[i], bounds[i + 1])
+      for i in range(len(cities)) if bounds[i] < bounds[i + 1]
+    }
+
+  @property
+  def cities(self):
+    return list(self.slices)
+
+  def city(self, city):
+    """All records of ``city`` without the city level."""
+    return self.frame.iloc[self.slices[city]].droplevel('city')
+
+  def select(self, city, years=None):
+    """Records of ``city`` within the inclusive year range."""
+    records = self.city(city)
+    if years is None:
+      return records
+    return records[year_mask(records.index, years)]
+
+  def items(self, years=None):
+    for city in self.slices:
+      yield city, self.select(city, years)
+
+
+@traced('filter')
+def partition_by_city(df):
+  """Group ``df`` by city once; see ``CityPartition``."""
+  return CityPartition(df)
+
+
+def year_windows(first, last, width, step=None, full=False):
+  """Inclusive ``(first, last)`` year windows of ``width`` years.
+
+  The last windows are cut short at ``last``; with ``full`` they are left
+  out instead, unless the years are fewer than ``width`` and make one
+  window.
+  """
+  step = width if step is None else step
+  stop = max(last - width + 1, first) if full else last
+  return [(start, min(start + width - 1, last))
+          for start in range(first, stop + 1, step)]
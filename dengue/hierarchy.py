@@ -0,0 +1,297 @@
+"""Hierarchical clustering on condensed distances.
+
+``scipy.cluster.hierarchy.linkage`` expects either the observations or a
+condensed distance vector. Passing it the square distance matrix, as the
+notebook first did, makes it treat every row as an n-dimensional point and
+compute a second set of distances between those rows: O(n^3) work, and a
+dendrogram of something other than the real distances. ``linkage_from_features``
+takes the feature matrix or a condensed vector instead.
+
+The condensed vector holds n(n-1)/2 values, half of the square matrix, and
+``condensed_distances`` can keep it as float32 and/or in a memory-mapped
+file for large n. Note that SciPy converts its input to float64 before
+building the tree, so float32 storage saves memory at rest, not during the
+linkage itself.
+
+``dendrogram_cuts`` explores many cuts of one linkage: the labels of every
+requested number of groups (or cut height) come from a single pass over
+the merges, and all of them are scored with the silhouette in one pass over
+the blocks of a ``DistanceStore``.
+"""
+
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import sparse
+from scipy.cluster import hierarchy
+from scipy.spatial.distance import cdist, pdist
+
+from dengue.distances import BLOCK_ROWS, DistanceStore, pairwise_blocks
+from dengue.trace import traced
+
+# Methods that are only defined for euclidean distances between observations
+OBSERVATION_METHODS = ('centroid', 'median', 'ward')
+
+
+def condensed_size(n):
+  return n * (n - 1) // 2
+
+
+@traced('distances')
+def condensed_distances(X, metric='euclidean', dtype=np.float64, path=None,
+                        block_rows=BLOCK_ROWS):
+  """Condensed pairwise distances of ``X``, as returned by ``pdist``.
+
+  With ``dtype=np.float32`` or a ``path`` (for a ``numpy.memmap`` on disk) the
+  vector is filled block by block, so no more than ``block_rows`` rows of the
+  square matrix exist at any time.
+  """
+  X = np.asarray(X)
+  n = len(X)
+  if path is None and np.dtype(dtype) == np.float64:
+    return pdist(X, metric=metric)
+  size = condensed_size(n)
+  if path is None:
+    out = np.empty(size, dtype=dtype)
+  else:
+    out = np.memmap(path, dtype=dtype, mode='w+', shape=(size,))
+  for start, stop, block in pairwise_blocks(X, metric=metric,
+                                            block_rows=block_rows):
+    for i in range(start, stop):
+      # Row i holds its distances to the points after it
+      offset = i * n - i * (i + 1) // 2
+      out[offset:offset + n - i - 1] = block[i - start, i + 1:]
+  if path is not None:
+    out.flush()
+  return out
+
+
+@traced('hierarchy')
+def linkage_from_features(X, method='complete', metric='euclidean',
+                          condensed=None):
+  """Linkage matrix for the rows of ``X``.
+
+  ``condensed`` may hold precomputed ``condensed_distances(X)``; otherwise
+  they are computed here, except for the centroid/median/ward methods, which
+  scipy computes from the observations.
+  """
+  if condensed is None:
+    if method in OBSERVATION_METHODS:
+      return hierarchy.linkage(np.asarray(X), method=method, metric=metric)
+    condensed = condensed_distances(X, metric=metric)
+  return hierarchy.linkage(condensed, method=method)
+
+
+def _measure(func, *args, **kwargs):
+  tracemalloc.start()
+  start = time.perf_counter()
+  try:
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  return result, seconds, peak
+
+
+def linkage_report(X, method='complete', metric='euclidean', dtype=np.float64,
+                   path=None, square=False):
+  """Run the linkage stage and report its time and peak memory.
+
+  Returns ``(Z, report)``. With ``square=True`` the former path, linkage over
+  the rows of the square distance matrix, is timed as well for comparison;
+  it is O(n^3), keep n small.
+  """
+  n = len(X)
+  distances, distance_seconds, distance_peak = _measure(
+      condensed_distances, X, metric=metric, dtype=dtype, path=path)
+  Z, linkage_seconds, linkage_peak = _measure(
+      linkage_from_features, X, method=method, metric=metric,
+      condensed=distances)
+  report = {
+    'n': n,
+    'method': method,
+    'distance_dtype': np.dtype(dtype).name,
+    'distance_bytes': int(distances.nbytes),
+    'distance_seconds': distance_seconds,
+    'distance_peak_bytes': distance_peak,
+    'linkage_seconds': linkage_seconds,
+    'linkage_peak_bytes': linkage_peak,
+  }
+  if square:
+    def square_path():
+      return hierarchy.linkage(cdist(X, X, metric=metric), method=method)
+    _, seconds, peak = _measure(square_path)
+    report['square_seconds'] = seconds
+    report['square_peak_bytes'] = peak
+  return Z, report
+
+
+def _fcluster_order(clusters):
+  # Leaves in the order fcluster numbers its groups: depth first from the
+  # root, the merged children of a node before its single points. Every
+  # group is a run of this order, numbered by the position of its first leaf
+  n = len(clusters) + 1
+  children = clusters[:, :2].astype(np.intp)
+  order = []
+  stack = [2 * n - 2]
+  while stack:
+    node = stack.pop()
+    if node < n:
+      order.append(node)
+      continue
+    # Pushed so that the merged children are popped first, left to right
+    pair = children[node - n]
+    stack.extend(sorted(pair[::-1].tolist(), key=lambda child: child >= n))
+  return np.array(order, dtype=np.intp)
+
+
+def merge_labels(clusters, n_clusters):
+  """``{k: labels}`` of the linkage cut into every ``k`` of ``n_clusters``.
+
+  The merges are replayed once, from n singletons down, relabelling the
+  smaller side of each merge, and the labels are recorded as each ``k`` is
+  reached. For monotonic linkages (every method but centroid and median)
+  they give the partitions of ``fcluster(clusters, k, 'maxclust')`` with
+  the same ids. When merges tie in height fcluster cannot cut between
+  them and may return fewer groups than k; here the ties are split in
+  merge order.
+  """
+  clusters = np.asarray(clusters)
+  n = len(clusters) + 1
+  wanted = {k for k in n_clusters if 1 <= k <= n}
+  label = np.arange(n)
+  members = {i: [i] for i in range(n)}
+  # Label carried by every node of the tree
+  node_label = list(range(n))
+  found = {}
+  if n in wanted:
+    found[n] = label.copy()
+  for step, (left, right) in enumerate(clusters[:, :2].astype(np.intp)):
+    keep, gone = node_label[left], node_label[right]
+    if len(members[keep]) < len(members[gone]):
+      keep, gone = gone, keep
+    moved = members.pop(gone)
+    label[moved] = keep
+    members[keep].extend(moved)
+    node_label.append(keep)
+    k = n - step - 1
+    if k in wanted:
+      found[k] = label.copy()
+  position = np.empty(n, dtype=np.intp)
+  position[_fcluster_order(clusters)] = np.arange(n)
+  result = {}
+  for k, labels in found.items():
+    first = np.full(n, n)
+    np.minimum.at(first, labels, position)
+    rank = np.empty(n, dtype=np.intp)
+    rank[np.argsort(first, kind='stable')] = np.arange(n)
+    result[k] = rank[labels] + 1
+  return result
+
+
+def silhouette_scores(store, labelings):
+  """Mean silhouette of every labelling, in one pass over ``store``.
+
+  Matches ``sklearn.metrics.silhouette_score`` on the stored distances; NaN
+  when a labelling has a single group or one group per point.
+  """
+  n = store.n
+  codes, sizes, indicators, within, nearest = [], [], [], [], []
+  for labels in labelings:
+    _, code = np.unique(labels, return_inverse=True)
+    k = code.max() + 1
+    codes.append(code)
+    sizes.append(np.bincount(code))
+    indicators.append(sparse.csr_matrix(
+        (np.ones(n), (code, np.arange(n))), shape=(k, n)))
+    within.append(np.empty(n))
+    nearest.append(np.empty(n))
+  # Each block of rows is reduced to the mean distance of every row to its
+  # own group (a) and to the nearest other group (b) before the next one
+  for start, stop, block in store.blocks():
+    rows = np.arange(stop - start)
+    for code, size, indicator, a, b in zip(codes, sizes, indicators, within,
+                                           nearest):
+      total = (indicator @ block.T).T
+      own = code[start:stop]
+      with np.errstate(invalid='ignore', divide='ignore'):
+        a[start:stop] = total[rows, own] / (size[own] - 1)
+      mean = total / size
+      mean[rows, own] = np.inf
+      b[start:stop] = mean.min(axis=1)
+  scores = []
+  for code, size, a, b in zip(codes, sizes, within, nearest):
+    if not 1 < len(size) < n:
+      scores.append(np.nan)
+      continue
+    with np.errstate(invalid='ignore', divide='ignore'):
+      s = (b - a) / np.maximum(a, b)
+    s[size[code] == 1] = 0
+    scores.append(float(np.nan_to_num(s).mean()))
+  return scores
+
+
+class DendrogramCuts:
+  """Labels, sizes and silhouettes of many cuts of one linkage."""
+
+  def __init__(self, cuts, n_clusters, labels, silhouettes):
+    self.cuts = list(cuts)
+    self.n_clusters = list(n_clusters)
+    self._labels = labels
+    self.silhouettes = list(silhouettes)
+
+  def labels(self, k):
+    """Labels of the cut into ``k`` groups."""
+    return self._labels[k]
+
+  def sizes(self, k):
+    return sorted(np.bincount(self._labels[k])[1:].tolist(), reverse=True)
+
+  def table(self):
+    """``[cut, groups, sizes, silhouette]`` rows, ready for ``tabulate``."""
+    return [[cut, k, self.sizes(k), s] for cut, k, s in
+            zip(self.cuts, self.n_clusters, self.silhouettes)]
+
+
+@traced('hierarchy')
+def dendrogram_cuts(clusters, n_clusters=None, heights=None, distances=None):
+  """Cut the linkage ``clusters`` many times; see ``DendrogramCuts``.
+
+  Cuts are given as numbers of groups, or as ``heights`` as for
+  ``fcluster(..., criterion='distance')``; by default every number of groups
+  from 2 to 20. The cut reported for a number of groups is the midpoint
+  between the merges around it, as the notebook chooses it. ``distances``, a
+  ``DistanceStore`` or the feature matrix the linkage was built from, is
+  used to score the silhouettes.
+  """
+  clusters = np.asarray(clusters)
+  n = len(clusters) + 1
+  merged = clusters[:, 2]
+  if heights is not None:
+    cuts = list(heights)
+    # The merges at or below a height are the ones made before the cut
+    n_clusters = [n - int(np.searchsorted(merged, h, side='right'))
+                  for h in cuts]
+  else:
+    if n_clusters is None:
+      n_clusters = range(2, min(n, 20) + 1)
+    n_clusters = list(n_clusters)
+    outside = [k for k in n_clusters if not 1 <= k <= n]
+    if outside:
+      raise ValueError('cannot cut %d points into %s groups'
+                       % (n, ', '.join(map(str, outside))))
+    padded = np.concatenate([[0], merged, [merged[-1] if len(merged) else 0]])
+    cuts = [(padded[n - k] + padded[n - k + 1]) / 2 for k in n_clusters]
+  labels = merge_labels(clusters, n_clusters)
+  if distances is None:
+    silhouettes = [np.nan] * len(n_clusters)
+  else:
+    if not isinstance(distances, DistanceStore):
+      distances = DistanceStore(distances)
+    scored = sorted(labels)
+    by_k = dict(zip(scored, silhouette_scores(distances,
+                                              [labels[k] for k in scored])))
+    silhouettes = [by_k[k] for k in n_clusters]
+  return DendrogramCuts(cuts, n_clusters, labels, silhouettes)
@@ -0,0 +1,194 @@
+"""Missing value imputation per city and per time window.
+
+The notebook runs ``KNNImputer`` over the whole unfiltered frame, all cities
+and years at once, and its brute-force nan-euclidean search is quadratic in
+the number of rows. Here imputation works on smaller groups, every city or
+every city and year window, with these methods:
+
+- ``'interpolate'`` / ``'ffill'``: along the chronological ``year/weekofyear``
+  order of each group, linear in the number of rows.
+- ``'knn'``: mean of the k nearest complete rows, from one KD-tree over the
+  complete rows of each group. A row is looked up with its gaps prefilled
+  with the column means, and the few times k candidates found are ranked
+  again on the columns it does have.
+- ``'knn_exact'``: ``sklearn.impute.KNNImputer`` on each group.
+
+With both k-nearest methods, a column empty in a group is filled with its
+mean over all the groups first, and a group with fewer complete rows than
+k goes to ``KNNImputer``, which finds donors column by column.
+
+``compare_imputers`` masks known values at random and reports the runtime
+and error of each method. ``carry_forward`` fills new batches of weeks
+from the last weeks of the previous batch.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.impute import KNNImputer
+from sklearn.neighbors import KDTree
+
+from dengue.trace import traced
+
+METHODS = ('interpolate', 'ffill', 'knn', 'knn_exact')
+
+
+def _group_positions(index, by_city=True, window=None):
+  # Row positions of every (city, year window) group
+  n = len(index)
+  if by_city and 'city' in index.names:
+    codes, _ = pd.factorize(index.get_level_values('city'))
+  else:
+    codes = np.zeros(n, dtype=np.intp)
+  if window is not None:
+    year = np.asarray(index.get_level_values('year'))
+    first = year.min()
+    codes = codes * (int((year.max() - first) // window) + 1) + (year - first) // window
+  order = np.argsort(codes, kind='stable')
+  bounds = np.flatnonzero(np.diff(codes[order])) + 1
+  return np.split(order, bounds)
+
+
+def _chronological(index, positions):
+  # Positions sorted by year, then week of the year
+  year = np.asarray(index.get_level_values('year'))[positions]
+  week = np.asarray(index.get_level_values('weekofyear'))[positions]
+  return positions[np.lexsort((week, year))]
+
+
+def _fill_series(values, method):
+  frame = pd.DataFrame(values)
+  if method == 'interpolate':
+    frame = frame.interpolate(method='linear', limit_direction='both')
+  else:
+    frame = frame.ffill()
+  # Leading gaps have no previous week, take the next one
+  return frame.bfill().to_numpy()
+
+
+def _fill_knn(values, n_neighbors, candidates=4):
+  missing = np.isnan(values)
+  complete = ~missing.any(axis=1)
+  donors = values[complete]
+  if len(donors) < n_neighbors:
+    # Too few complete rows; KNNImputer takes donors column by column
+    imputer = KNNImputer(n_neighbors=n_neighbors, keep_empty_features=True)
+    return imputer.fit_transform(values)
+  k = n_neighbors
+  rows = np.flatnonzero(~complete)
+  gaps = missing[rows]
+  targets = values[rows]
+  # One tree over the complete rows of the group. Incomplete rows are
+  # looked up with their gaps prefilled with the column means, and the
+  # candidates found are ranked again on the columns the row does have
+  means = donors.mean(axis=0)
+  prefilled = np.where(gaps, means, targets)
+  n_candidates = min(max(candidates * k, k), len(donors))
+  _, nearest = KDTree(donors).query(prefilled, k=n_candidates)
+  difference = donors[nearest] - prefilled[:, None, :]
+  difference[np.broadcast_to(gaps[:, None, :], difference.shape)] = 0
+  distance = np.einsum('ijk,ijk->ij', difference, difference)
+  best = np.argpartition(distance, k - 1, axis=1)[:, :k]
+  nearest = np.take_along_axis(nearest, best, axis=1)
+  filled = donors[nearest].mean(axis=1)
+  # Rows without any observed value get the column means
+  filled[gaps.all(axis=1)] = means
+  values[rows] = np.where(gaps, filled, targets)
+  return values
+
+
+@traced('impute')
+def impute(df, method='interpolate', by_city=True, window=None, n_neighbors=5):
+  """Copy of ``df`` with the missing values filled in.
+
+  ``by_city`` imputes every city on its own and ``window`` further splits
+  each city into blocks of that many years.
+  """
+  if method not in METHODS:
+    raise ValueError('unknown imputation method %r, use one of %s'
+                     % (method, ', '.join(METHODS)))
+  values = df.to_numpy(dtype=np.float64, copy=True)
+  # Columns empty in a group take the mean over all groups, or 0 as
+  # KNNImputer's keep_empty_features when they are empty everywhere
+  known = (~np.isnan(values)).sum(axis=0)
+  means = np.divide(np.nansum(values, axis=0), known,
+                    out=np.zeros(values.shape[1]), where=known > 0)
+  for positions in _group_positions(df.index, by_city, window):
+    group = values[positions]
+    if not np.isnan(group).any():
+      continue
+    if method in ('knn', 'knn_exact'):
+      empty = np.isnan(group).all(axis=0)
+      group[:, empty] = means[empty]
+    if method in ('interpolate', 'ffill'):
+      positions = _chronological(df.index, positions)
+      values[positions] = _fill_series(values[positions], method)
+    elif method == 'knn':
+      values[positions] = _fill_knn(group, n_neighbors)
+    else:
+      imputer = KNNImputer(n_neighbors=n_neighbors, keep_empty_features=True)
+      values[positions] = imputer.fit_transform(group)
+  return pd.DataFrame(values, index=df.index, columns=df.columns).astype(
+      df.dtypes.to_dict())
+
+
+def mask_values(df, fraction=0.05, random_state=0):
+  """``(masked, mask)``: ``df`` with a fraction of its known values hidden."""
+  rng = np.random.RandomState(random_state)
+  known = df.notna().to_numpy()
+  mask = known & (rng.random_sample(known.shape) < fraction)
+  return df.mask(mask), mask
+
+
+def compare_imputers(df, methods=METHODS, fraction=0.05, by_city=True,
+                     window=None, n_neighbors=5, random_state=0):
+  """Runtime and error of each method on artificially masked values.
+
+  Errors are RMSE over the hidden cells, every column divided by its
+  standard deviation first so the features weigh the same. Returns
+  ``[method, seconds, rmse]`` rows, ready for ``tabulate``.
+  """
+  masked, mask = mask_values(df, fraction, random_state)
+  truth = df.to_numpy(dtype=np.float64)
+  scale = np.nanstd(truth, axis=0)
+  scale[scale == 0] = 1
+  results = []
+  for method in methods:
+    start = time.perf_counter()
+    filled = impute(masked, method, by_city=by_city, window=window,
+                    n_neighbors=n_neighbors)
+    seconds = time.perf_counter() - start
+    error = ((filled.to_numpy(dtype=np.float64) - truth) / scale)[mask]
+    results.append([method, seconds, float(np.sqrt(np.nanmean(error ** 2)))])
+  return results
+
+
+def carry_forward(df, last_rows=None, fill_values=None):
+  """Forward fill a new batch of weeks, continuing from earlier batches.
+
+  ``last_rows`` maps every city to the last week seen for it, so the first
+  weeks of the batch can take their values from the previous batch; what is
+  still missing then gets ``fill_values`` (one value per column). Returns the
+  filled copy and the updated ``last_rows``.
+  """
+  last_rows = dict(last_rows or {})
+  values = df.to_numpy(dtype=np.float64, copy=True)
+  has_city = 'city' in df.index.names
+  for positions in _group_positions(df.index, by_city=True):
+    positions = _chronological(df.index, positions)
+    city = df.index.get_level_values('city')[positions[0]] if has_city else None
+    group = values[positions]
+    previous = last_rows.get(city)
+    if previous is not None:
+      group = np.vstack([previous, group])
+    group = pd.DataFrame(group).ffill().to_numpy()
+    if previous is not None:
+      group = group[1:]
+    values[positions] = group
+    last_rows[city] = group[-1]
+  if fill_values is not None:
+    values = np.where(np.isnan(values), np.asarray(fill_values), values)
+  filled = pd.DataFrame(values, index=df.index, columns=df.columns).astype(
+      df.dtypes.to_dict())
+  return filled, last_rows
@@ -0,0 +1,195 @@
+"""K-means model selection over a grid of ``k``.
+
+``kmeans_sweep`` fits every ``k`` of the grid, either in parallel across a
+process pool or sequentially with each ``k + 1`` warm-started from the
+centroids found for ``k``. Silhouettes for the whole grid are scored against
+one pairwise-distance block, computed once (on a fixed sample of the points
+for large ``n``), and every fitted model is kept so the final choice of
+``k`` is a lookup instead of a refit.
+
+``StreamingKMeans`` keeps the centroids of a fitted model up to date as new
+weeks arrive, with mini-batch updates, and labels them against the current
+centroids.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn import metrics
+from sklearn.cluster import KMeans
+
+from dengue.trace import traced
+
+# Defaults of the notebook's K-means parametrization
+KMEANS_PARAMS = {'init': 'random', 'n_init': 10, 'max_iter': 300,
+                 'tol': 1e-04, 'random_state': 0}
+
+_worker_X = None
+
+
+def _init_worker(X):
+  # Each worker receives the data once instead of once per k
+  global _worker_X
+  _worker_X = X
+
+
+def _fit_worker(args):
+  k, params = args
+  return KMeans(k, **params).fit(_worker_X)
+
+
+def _next_centroids(X, km):
+  # Keep the k centroids and add the point worst served by them
+  distances = km.transform(X)[np.arange(len(X)), km.labels_]
+  return np.vstack([km.cluster_centers_, X[np.argmax(distances)]])
+
+
+class KMeansSweep:
+  """Fitted models, distortions and silhouettes for each ``k`` of a grid."""
+
+  def __init__(self, ks, models, silhouettes):
+    self.ks = list(ks)
+    self.models = models
+    self.distortions = [models[k].inertia_ for k in self.ks]
+    self.silhouettes = [silhouettes[k] for k in self.ks]
+
+  def model(self, k):
+    """The model fitted for ``k``."""
+    return self.models[k]
+
+  def labels(self, k):
+    return self.models[k].labels_
+
+  def table(self):
+    """``[k, sse, silhouette]`` rows, ready for ``tabulate``."""
+    return [[k, sse, s] for k, sse, s in
+            zip(self.ks, self.distortions, self.silhouettes)]
+
+
+def silhouette_block(X, sample_size=None, random_state=0):
+  """Row indices and the pairwise distances shared by every silhouette."""
+  n = len(X)
+  if sample_size is None or sample_size >= n:
+    rows = np.arange(n)
+  else:
+    rng = np.random.RandomState(random_state)
+    rows = np.sort(rng.choice(n, sample_size, replace=False))
+  return rows, metrics.pairwise_distances(X[rows])
+
+
+@traced('kmeans')
+def kmeans_sweep(X, ks=range(2, 13), n_jobs=None, warm_start=False,
+                 silhouette_sample=None, **params):
+  """Fit K-means for every ``k`` in ``ks``; see ``KMeansSweep``.
+
+  ``n_jobs`` sets the size of the process pool (``None`` fits in this
+  process). ``warm_start`` fits the grid in increasing order, seeding each
+  ``k`` with the previous centroids; it is sequential by nature, so it
+  ignores ``n_jobs``. ``params`` override ``KMEANS_PARAMS``.
+  """
+  ks = sorted(ks)
+  params = dict(KMEANS_PARAMS, **params)
+  X = np.asarray(X)
+  models = {}
+  if warm_start:
+    models[ks[0]] = KMeans(ks[0], **params).fit(X)
+    for prev, k in zip(ks, ks[1:]):
+      if k == prev + 1:
+        seeded = dict(params, init=_next_centroids(X, models[prev]), n_init=1)
+        models[k] = KMeans(k, **seeded).fit(X)
+      else:
+        models[k] = KMeans(k, **params).fit(X)
+  elif n_jobs is not None and n_jobs != 1:
+    with ProcessPoolExecutor(max_workers=n_jobs if n_jobs > 0 else None,
+                             initializer=_init_worker,
+                             initargs=(X,)) as pool:
+      fitted = pool.map(_fit_worker, [(k, params) for k in ks])
+      models = dict(zip(ks, fitted))
+  else:
+    models = {k: KMeans(k, **params).fit(X) for k in ks}
+
+  rows, distances = silhouette_block(X, silhouette_sample,
+                                     params.get('random_state'))
+  silhouettes = {}
+  for k in ks:
+    labels = models[k].labels_[rows]
+    if len(np.unique(labels)) < 2:
+      silhouettes[k] = np.nan
+    else:
+      silhouettes[k] = metrics.silhouette_score(distances, labels,
+                                                metric='precomputed')
+  return KMeansSweep(ks, models, silhouettes)
+
+
+class StreamingKMeans:
+  """Mini-batch K-means that keeps the cluster ids of its initial centroids.
+
+  Every centroid moves towards the mean of the points assigned to it with
+  a learning rate of one over the number of points it has absorbed, so its
+  id, and the name the notebook gives its group, never changes.
+  ``max_drift`` bounds how far a centroid may move away from where it
+  started.
+  """
+
+  def __init__(self, centroids, counts=None, max_drift=None):
+    self.cluster_centers_ = np.array(centroids, dtype=np.float64)
+    self.initial_centers_ = self.cluster_centers_.copy()
+    k = len(self.cluster_centers_)
+    if counts is None:
+      counts = np.zeros(k)
+    self.counts_ = np.asarray(counts, dtype=np.float64).copy()
+    self.max_drift = max_drift
+
+  @classmethod
+  def from_model(cls, km, max_drift=None):
+    """Start from a fitted ``KMeans``, weighting centroids by cluster size."""
+    counts = np.bincount(km.labels_, minlength=km.n_clusters)
+    return cls(km.cluster_centers_, counts, max_drift=max_drift)
+
+  @property
+  def n_clusters(self):
+    return len(self.cluster_centers_)
+
+  def transform(self, X):
+    """Distances from every row to every centroid."""
+    X = np.asarray(X, dtype=np.float64)
+    squared = ((X ** 2).sum(axis=1)[:, None]
+               - 2 * X @ self.cluster_centers_.T
+               + (self.cluster_centers_ ** 2).sum(axis=1)[None, :])
+    return np.sqrt(np.maximum(squared, 0))
+
+  def predict(self, X):
+    """Nearest centroid of every row, O(k d) each."""
+    return np.argmin(self.transform(X), axis=1)
+
+  @traced('kmeans')
+  def partial_fit(self, X):
+    """Move the centroids towards a new batch of points."""
+    X = np.asarray(X, dtype=np.float64)
+    labels = self.predict(X)
+    k = self.n_clusters
+    batch_counts = np.bincount(labels, minlength=k).astype(np.float64)
+    batch_sums = np.zeros_like(self.cluster_centers_)
+    np.add.at(batch_sums, labels, X)
+    updated = batch_counts > 0
+    self.counts_ += batch_counts
+    self.cluster_centers_[updated] += (
+        (batch_sums[updated]
+         - batch_counts[updated, None] * self.cluster_centers_[updated])
+        / self.counts_[updated, None])
+    if self.max_drift is not None:
+      shift = self.cluster_centers_ - self.initial_centers_
+      norm = np.linalg.norm(shift, axis=1)
+      over = norm > self.max_drift
+      self.cluster_centers_[over] = (self.initial_centers_[over]
+                                     + shift[over] * (self.max_drift
+                                                      / norm[over, None]))
+    return self
+
+  def partial_fit_predict(self, X):
+    """Update with the batch, then label it."""
+    return self.partial_fit(X).predict(X)
+
+  def drift(self):
+    """Distance of every centroid from where it started."""
+    return np.linalg.norm(self.cluster_centers_ - self.initial_centers_, axis=1)
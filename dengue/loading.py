@@ -0,0 +1,147 @@
+"""Headless, chunked loading of the DengAI feature files.
+
+``read_features`` replaces the Colab ``files.upload()`` ingest: it takes a
+local path or any file-like object, parses it in chunks with explicit dtypes
+and builds the ``city/weekofyear/year`` MultiIndex chunk by chunk, so the
+whole CSV is never held as text. Parsed frames can be written to a columnar
+cache (Parquet or ``.npz``) that later runs load without touching the CSV.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from dengue.features import INDEX_FIELDS, FEATURE_COLUMNS, DATE_COLUMN
+from dengue.trace import traced
+
+# Rows parsed per chunk
+CHUNKSIZE = 50000
+
+CACHE_FORMATS = ('.parquet', '.npz')
+
+
+def feature_dtypes(columns=FEATURE_COLUMNS):
+  """Explicit dtypes for the CSV reader: float32 climate, small int keys."""
+  dtypes = {column: np.float32 for column in columns}
+  dtypes.update({'city': 'category', 'weekofyear': np.int16, 'year': np.int16})
+  return dtypes
+
+
+def _categorical_city(df, index_fields):
+  # Concatenated chunks may fall back to an object level, restore it
+  if 'city' not in index_fields:
+    return df
+  level = index_fields.index('city')
+  if len(index_fields) == 1:
+    df.index = pd.CategoricalIndex(df.index, name='city')
+    return df
+  cities = df.index.levels[level]
+  if not isinstance(cities, pd.CategoricalIndex):
+    df.index = df.index.set_levels(
+        pd.CategoricalIndex(cities.astype(str), name='city'), level=level)
+  return df
+
+
+def read_csv_chunked(source, index_fields=INDEX_FIELDS, chunksize=CHUNKSIZE,
+                     drop_columns=(), dtypes=None):
+  """Parse a features CSV chunk by chunk into an indexed float32 frame."""
+  if dtypes is None:
+    dtypes = feature_dtypes()
+  usecols = None
+  if drop_columns:
+    usecols = lambda column: column not in drop_columns
+  reader = pd.read_csv(source, dtype=dtypes, usecols=usecols,
+                       chunksize=chunksize)
+  chunks = [chunk.set_index(index_fields) for chunk in reader]
+  if not chunks:
+    raise ValueError('no records found in %r' % (source,))
+  df = pd.concat(chunks, copy=False) if len(chunks) > 1 else chunks[0]
+  return _categorical_city(df, list(index_fields))
+
+
+def write_cache(df, path):
+  """Store an indexed frame as Parquet or as a ``.npz`` of plain arrays."""
+  ext = os.path.splitext(path)[1]
+  if ext == '.parquet':
+    df.to_parquet(path)
+  elif ext == '.npz':
+    arrays = {'__columns__': np.asarray(df.columns, dtype=str),
+              '__index__': np.asarray(df.index.names, dtype=str)}
+    for i, name in enumerate(df.index.names):
+      level = df.index.get_level_values(i)
+      if isinstance(level, pd.CategoricalIndex):
+        arrays['codes:' + name] = level.codes
+        arrays['categories:' + name] = np.asarray(level.categories, dtype=str)
+      else:
+        arrays['level:' + name] = np.asarray(level)
+    # One array per column keeps each dtype and can be memory-mapped later
+    for i, column in enumerate(df.columns):
+      values = df[column].to_numpy()
+      if values.dtype == object:
+        values = values.astype(str)
+      arrays['column:%d' % i] = values
+    with open(path, 'wb') as fh:
+      np.savez(fh, **arrays)
+  else:
+    raise ValueError('unsupported cache format %r, use one of %s'
+                     % (ext, ', '.join(CACHE_FORMATS)))
+
+
+def read_cache(path):
+  """Load a frame written by ``write_cache``."""
+  ext = os.path.splitext(path)[1]
+  if ext == '.parquet':
+    return pd.read_parquet(path)
+  if ext != '.npz':
+    raise ValueError('unsupported cache format %r, use one of %s'
+                     % (ext, ', '.join(CACHE_FORMATS)))
+  with np.load(path) as data:
+    levels = []
+    for name in data['__index__']:
+      if 'codes:' + name in data:
+        levels.append(pd.Categorical.from_codes(
+            data['codes:' + name], data['categories:' + name]))
+      else:
+        levels.append(data['level:' + name])
+    names = list(data['__index__'])
+    if len(names) > 1:
+      index = pd.MultiIndex.from_arrays(levels, names=names)
+    else:
+      index = pd.Index(levels[0], name=names[0])
+    columns = list(data['__columns__'])
+    values = {column: data['column:%d' % i] for i, column in enumerate(columns)}
+  return pd.DataFrame(values, index=index, columns=columns)
+
+
+def _cache_is_fresh(source, cache):
+  if not os.path.exists(cache):
+    return False
+  if isinstance(source, (str, os.PathLike)):
+    return os.path.getmtime(cache) >= os.path.getmtime(source)
+  # File-like sources cannot be dated, trust the cache
+  return True
+
+
+@traced('load')
+def read_features(source, index_fields=INDEX_FIELDS, cache=None,
+                  chunksize=CHUNKSIZE, drop_columns=(), refresh=False):
+  """Load the weekly features from a path or file-like object.
+
+  With ``cache`` set to a ``.parquet`` or ``.npz`` path the parsed frame is
+  written there, and reused on the next call as long as it is not older
+  than ``source``.
+  """
+  if cache is not None and not refresh and _cache_is_fresh(source, cache):
+    return read_cache(cache)
+  df = read_csv_chunked(source, index_fields, chunksize=chunksize,
+                        drop_columns=drop_columns)
+  if cache is not None:
+    write_cache(df, cache)
+  return df
+
+
+def read_train_features(source, cache=None, chunksize=CHUNKSIZE):
+  """``read_features`` with the notebook defaults: indexed, no start date."""
+  return read_features(source, INDEX_FIELDS, cache=cache, chunksize=chunksize,
+                       drop_columns=(DATE_COLUMN,))
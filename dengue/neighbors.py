@@ -0,0 +1,56 @@
+"""k-distance curve and ``eps`` suggestion for DBSCAN.
+
+The distance of every point to its k-th nearest neighbour is queried from a
+KD-tree (or ball tree) in O(n log n); no n x n matrix is ever built. The
+sorted curve is what the notebook plots to choose ``eps`` by eye, and
+``knee_point`` picks its elbow automatically.
+"""
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from dengue.trace import traced
+
+
+@traced('neighbors')
+def neighbor_distances(X, k, algorithm='kd_tree', metric='euclidean'):
+  """Distances from each point to its ``k`` nearest neighbours (self excluded).
+
+  Returns an ``(n, k)`` array, each row in increasing order.
+  """
+  nn = NearestNeighbors(n_neighbors=k, algorithm=algorithm, metric=metric)
+  nn.fit(X)
+  # Querying without X leaves every point out of its own neighbourhood
+  distances, _ = nn.kneighbors()
+  return distances
+
+
+def k_distances(X, k, algorithm='kd_tree', metric='euclidean'):
+  """Sorted distances from each point to its k-th nearest neighbour."""
+  distances = neighbor_distances(X, k, algorithm=algorithm, metric=metric)
+  return np.sort(distances[:, -1])
+
+
+def knee_point(curve):
+  """Index of the elbow of an increasing curve.
+
+  The point furthest from the chord joining the first and last values, once
+  both axes are scaled to [0, 1].
+  """
+  curve = np.asarray(curve, dtype=float)
+  n = len(curve)
+  if n < 3:
+    return n - 1
+  x = np.linspace(0.0, 1.0, n)
+  span = curve[-1] - curve[0]
+  if span == 0:
+    return n - 1
+  y = (curve - curve[0]) / span
+  # Convex increasing curve: the knee lies furthest below the chord y = x
+  return int(np.argmax(x - y))
+
+
+def suggest_eps(X, k, algorithm='kd_tree', metric='euclidean'):
+  """``(eps, curve)``: the knee of the k-distance curve and the curve itself."""
+  curve = k_distances(X, k, algorithm=algorithm, metric=metric)
+  return curve[knee_point(curve)], curve
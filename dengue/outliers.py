@@ -0,0 +1,261 @@
+"""DBSCAN outlier detection over a sweep of ``eps`` values.
+
+A point is a DBSCAN core point at ``eps`` when its ``min_samples - 1``-th
+nearest neighbour is within ``eps`` (its core distance), and two core points
+are linked when they are within ``eps`` of each other. So two core points
+share a cluster at ``eps`` exactly when the minimum spanning tree of the
+mutual reachability distance, ``max(d(a, b), core(a), core(b))``, joins them
+with edges of at most ``eps``. ``DBSCANSweep`` computes the core distances
+with one k-nearest-neighbour query, and that tree from the sparse graph of
+the pairs of core points within ``max_eps``, part of the neighbourhoods a
+single DBSCAN fit at ``max_eps`` searches; only the tree edges are kept,
+sorted by weight.
+The edges within any ``eps`` are a prefix of that list, and the clusters
+are built by merging them in order, continuing from the previous ``eps``
+of the sweep. Border points join the first cluster that reaches them;
+their core neighbours are among their nearest neighbours, since they have
+fewer than ``min_samples`` points within ``eps``. Labels match
+``sklearn.cluster.DBSCAN`` fitted with the same parameters, clusters
+numbered in the same order.
+
+``OutlierModel`` keeps only the core samples of one labelling in a KD-tree,
+so new weeks are scored without a refit: a row within ``eps`` of a core
+point joins that point's cluster, any other row is an outlier.
+"""
+
+import pickle
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import minimum_spanning_tree
+from sklearn.neighbors import BallTree, KDTree, NearestNeighbors
+
+from dengue.trace import traced
+
+
+# Stands for a zero weight, which sparse graphs would take as no edge
+_ZERO = np.nextafter(0, 1)
+
+
+def _spanning_tree(X, core_distances, max_eps, algorithm, metric):
+  # Minimum spanning forest of the mutual reachability distance over the
+  # pairs of core points within max_eps. By the cut property its edges up
+  # to any eps <= max_eps join the same points as all the pairs up to eps
+  core = np.flatnonzero(core_distances <= max_eps)
+  empty = np.empty(0, dtype=np.intp)
+  if len(core) < 2:
+    return empty, empty, np.empty(0)
+  nn = NearestNeighbors(radius=max_eps, algorithm=algorithm, metric=metric)
+  graph = nn.fit(X[core]).radius_neighbors_graph(mode='distance')
+  row = np.repeat(np.arange(len(core)), np.diff(graph.indptr))
+  col = graph.indices
+  # Every pair is there both ways, one is enough for the tree
+  keep = row < col
+  row, col = row[keep], col[keep]
+  reach = np.maximum(graph.data[keep], np.maximum(core_distances[core[row]],
+                                                  core_distances[core[col]]))
+  reach[reach == 0] = _ZERO
+  tree = minimum_spanning_tree(sparse.csr_matrix(
+      (reach, (row, col)), shape=(len(core), len(core)))).tocoo()
+  weights = np.where(tree.data == _ZERO, 0, tree.data)
+  return core[tree.row], core[tree.col], weights
+
+
+class DBSCANSweep:
+  """Neighbourhoods computed once, DBSCAN labels for any ``eps <= max_eps``."""
+
+  @traced('dbscan')
+  def __init__(self, X, max_eps, min_samples=5, algorithm='auto',
+               metric='euclidean'):
+    self.max_eps = max_eps
+    self.min_samples = min_samples
+    self.metric = metric
+    self.X = np.asarray(X)
+    n = self.n_samples = len(X)
+    k = min(max(min_samples - 1, 1), n - 1)
+    if k > 0:
+      nn = NearestNeighbors(n_neighbors=k, algorithm=algorithm, metric=metric)
+      # Without X every point is left out of its own neighbourhood
+      self.neighbor_distances, self.neighbors = nn.fit(X).kneighbors()
+    else:
+      self.neighbor_distances = np.empty((n, 0))
+      self.neighbors = np.empty((n, 0), dtype=np.intp)
+    if min_samples <= 1:
+      self.core_distances = np.zeros(n)
+    elif min_samples - 1 > k:
+      # Fewer points than min_samples, nothing can be core
+      self.core_distances = np.full(n, np.inf)
+    else:
+      self.core_distances = self.neighbor_distances[:, -1]
+    first, second, weights = _spanning_tree(self.X, self.core_distances,
+                                            max_eps, algorithm, metric)
+    order = np.argsort(weights, kind='stable')
+    self.first, self.second = first[order], second[order]
+    self.weights = weights[order]
+    self._reset()
+
+  def _reset(self):
+    n = self.n_samples
+    self._eps = -np.inf
+    self._done = 0
+    self._parent = list(range(n))
+
+  def _root(self, points):
+    # Roots of the merged clusters, all points at once
+    parent = np.asarray(self._parent)
+    root = parent[points]
+    while True:
+      up = parent[root]
+      if np.array_equal(up, root):
+        return root
+      root = up
+
+  def _advance(self, eps):
+    if eps > self.max_eps:
+      raise ValueError('eps=%g is above the swept maximum %g'
+                       % (eps, self.max_eps))
+    if eps < self._eps:
+      self._reset()
+    stop = int(np.searchsorted(self.weights, eps, side='right'))
+    # Union of the tree edges that enter, in order of weight; a tree has no
+    # cycle, so every edge joins two different clusters
+    parent = self._parent
+    for a, b in zip(self.first[self._done:stop].tolist(),
+                    self.second[self._done:stop].tolist()):
+      while parent[a] != a:
+        parent[a] = a = parent[parent[a]]
+      while parent[b] != b:
+        parent[b] = b = parent[parent[b]]
+      parent[max(a, b)] = min(a, b)
+    self._done = stop
+    self._eps = eps
+
+  def core_mask(self, eps):
+    """True for the core samples at ``eps``."""
+    self._advance(eps)
+    return self.core_distances <= eps
+
+  def labels(self, eps):
+    """DBSCAN labels for ``eps``, -1 marking the outliers."""
+    self._advance(eps)
+    n = self.n_samples
+    labels = np.full(n, -1, dtype=np.intp)
+    is_core = self.core_distances <= eps
+    core = np.flatnonzero(is_core)
+    if len(core) == 0:
+      return labels
+    # Roots are the smallest point of every cluster, so numbering them in
+    # increasing order numbers the clusters by their first core point, as
+    # DBSCAN expands them
+    root = self._root(core)
+    found, numbering = np.unique(root, return_inverse=True)
+    labels[core] = numbering
+
+    # Border points take the lowest numbered cluster among their core
+    # neighbours, the first one to reach them
+    within = (self.neighbor_distances <= eps) & is_core[self.neighbors]
+    within[is_core] = False
+    if within.any():
+      reached = np.where(within, labels[self.neighbors], len(found))
+      best = reached.min(axis=1)
+      hit = best < len(found)
+      labels[hit] = best[hit]
+    return labels
+
+  @traced('dbscan')
+  def sweep(self, eps_values):
+    """``(results, labels)``: ``[eps, clusters, outliers]`` rows and labels."""
+    eps_values = list(eps_values)
+    labels = {}
+    # Increasing eps, so every step only adds to the previous one
+    for eps in sorted(eps_values):
+      labels[eps] = self.labels(eps)
+    results = []
+    for eps in eps_values:
+      found = labels[eps]
+      n_clusters = len(np.unique(found[found >= 0]))
+      n_outliers = int(np.count_nonzero(found == -1))
+      results.append([eps, n_clusters, n_outliers])
+    return results, labels
+
+  def outlier_model(self, eps):
+    """``OutlierModel`` of the labelling at ``eps``."""
+    core = self.core_mask(eps)
+    return OutlierModel(self.X[core], eps, self.labels(eps)[core],
+                        metric=self.metric)
+
+
+class OutlierModel:
+  """Core samples of a DBSCAN labelling, indexed to score new rows.
+
+  ``predict`` gives each row the cluster of its nearest core point when that
+  point is within ``eps``, and -1 otherwise; a tree query costs O(log n) per
+  row, against the neighbourhoods of the whole history for a refit. New rows
+  must be scaled like the ones the model was built from.
+  """
+
+  def __init__(self, core_samples, eps, core_labels=None, metric='euclidean',
+               leaf_size=40):
+    self.core_samples = np.asarray(core_samples, dtype=np.float64)
+    self.eps = eps
+    self.metric = metric
+    if core_labels is None:
+      core_labels = np.zeros(len(self.core_samples), dtype=np.intp)
+    self.core_labels = np.asarray(core_labels)
+    self.tree = None
+    if len(self.core_samples):
+      index = KDTree if metric in KDTree.valid_metrics else BallTree
+      self.tree = index(self.core_samples, leaf_size=leaf_size, metric=metric)
+
+  @classmethod
+  def from_dbscan(cls, model, leaf_size=40):
+    """Build from a fitted ``sklearn.cluster.DBSCAN``."""
+    return cls(model.components_, model.eps,
+               model.labels_[model.core_sample_indices_],
+               metric=model.metric, leaf_size=leaf_size)
+
+  def nearest(self, X):
+    """``(distances, indices)`` of the nearest core point of every row."""
+    X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+    if self.tree is None:
+      return np.full(len(X), np.inf), np.full(len(X), -1, dtype=np.intp)
+    distances, indices = self.tree.query(X, k=1)
+    return distances[:, 0], indices[:, 0]
+
+  def score(self, X):
+    """Distance from every row to the nearest core point."""
+    return self.nearest(X)[0]
+
+  @traced('dbscan')
+  def predict(self, X):
+    """Cluster of the nearest core point within ``eps``, or -1."""
+    distances, indices = self.nearest(X)
+    labels = np.full(len(distances), -1, dtype=np.intp)
+    within = distances <= self.eps
+    labels[within] = self.core_labels[indices[within]]
+    return labels
+
+  def is_outlier(self, X):
+    """True for the rows with no core point within ``eps``."""
+    return self.score(X) > self.eps
+
+  def save(self, path):
+    with open(path, 'wb') as fh:
+      pickle.dump(self, fh)
+
+  @classmethod
+  def load(cls, path):
+    with open(path, 'rb') as fh:
+      model = pickle.load(fh)
+    if not isinstance(model, cls):
+      raise TypeError('%s does not hold a %s' % (path, cls.__name__))
+    return model
+
+
+def dbscan_sweep(X, eps_values, min_samples=5, algorithm='auto',
+                 metric='euclidean'):
+  """Sweep DBSCAN over ``eps_values`` with one neighbourhood computation."""
+  eps_values = list(eps_values)
+  search = DBSCANSweep(X, max(eps_values), min_samples=min_samples,
+                       algorithm=algorithm, metric=metric)
+  return search.sweep(eps_values)
@@ -0,0 +1,172 @@
+"""Preprocessing of the notebook as a single fitted, persistable object.
+
+``DenguePipeline`` wraps the steps the notebook runs inline: drop
+``week_start_date``, impute (over all the cities, as the notebook does,
+unless ``by_city``), keep one city and a range of years, scale with
+``MinMaxScaler`` and project with PCA. Its fitted state (scaler, PCA, the
+last week seen per city and the column means used as fallback imputation)
+is pickled with ``save``, so new batches of weeks are scored with
+``transform`` without going over the history again.
+
+With ``variance`` (a target explained-variance fraction), or with
+``svd_solver`` and ``n_components`` set, the projection is a
+``TruncatedProjection`` that only computes the components it keeps.
+
+``partial_fit`` keeps the model up to date batch by batch: the scaler
+extends its running min/max and the projection is an ``IncrementalPCA``.
+Batches fitted this way are scaled with the min/max known at the time, so
+the projection drifts slightly from what a full refit would give.
+"""
+
+import pickle
+
+from sklearn import preprocessing
+from sklearn.decomposition import PCA, IncrementalPCA
+
+from dengue.features import DATE_COLUMN
+from dengue.filtering import select_records
+from dengue.imputation import carry_forward, impute
+from dengue.reduction import TruncatedProjection
+from dengue.trace import stage
+
+
+def prepare_features(df, city, years, impute_method='knn_exact', n_neighbors=5,
+                     by_city=False):
+  """Drop the date, impute over the whole history and keep city and years.
+
+  As in the notebook every city is imputed from the weeks of all of them;
+  ``by_city`` imputes each city from its own weeks only.
+  """
+  with stage('drop', df):
+    if DATE_COLUMN in df.columns:
+      df = df.drop(columns=DATE_COLUMN)
+  df = impute(df, impute_method, by_city=by_city, n_neighbors=n_neighbors)
+  if 'city' not in df.index.names:
+    return df
+  return select_records(df, city, years).droplevel('city')
+
+
+class DenguePipeline:
+  """drop date -> impute -> filter -> MinMaxScaler -> PCA."""
+
+  def __init__(self, city='sj', years=(1990, 1996), impute_method='knn_exact',
+               n_neighbors=5, n_components=None, incremental=False,
+               batch_size=None, variance=None, svd_solver=None, by_city=False):
+    self.city = city
+    self.years = years
+    self.impute_method = impute_method
+    self.n_neighbors = n_neighbors
+    self.by_city = by_city
+    self.n_components = n_components
+    self.incremental = incremental
+    self.batch_size = batch_size
+    self.variance = variance
+    self.svd_solver = svd_solver
+    self.scaler = None
+    self.pca = None
+    self.columns = None
+    self.fill_values_ = None
+    self.last_rows_ = {}
+
+  def _new_pca(self):
+    if self.incremental:
+      return IncrementalPCA(n_components=self.n_components,
+                            batch_size=self.batch_size)
+    if self.variance is not None or (self.svd_solver is not None
+                                     and self.n_components is not None):
+      return TruncatedProjection(self.n_components, self.variance,
+                                 svd_solver=self.svd_solver or 'randomized')
+    # Without a cutoff every component is kept, nothing to truncate
+    return PCA(n_components=self.n_components,
+               svd_solver=self.svd_solver or 'auto')
+
+  def _select(self, df, years):
+    if 'city' not in df.index.names:
+      return df
+    records = select_records(df, self.city, years)
+    return records.droplevel('city')
+
+  def prepare(self, df):
+    """Drop the date, impute over the whole history and filter."""
+    return prepare_features(df, self.city, self.years, self.impute_method,
+                            self.n_neighbors, self.by_city)
+
+  def fit_features(self, features):
+    """Fit scaler and PCA on an already prepared frame."""
+    self.columns = list(features.columns)
+    self.fill_values_ = features.mean().to_numpy()
+    with stage('scale', features) as span:
+      self.scaler = preprocessing.MinMaxScaler()
+      scaled = self.scaler.fit_transform(features)
+      span.output(scaled)
+    with stage('pca', scaled):
+      self.pca = self._new_pca()
+      self.pca.fit(scaled)
+    return self
+
+  def fit(self, df):
+    """Fit every stage on the full history ``df``."""
+    features = self.prepare(df)
+    self._remember_last_rows(df)
+    return self.fit_features(features)
+
+  def _remember_last_rows(self, df):
+    # Last week of every city, to continue the forward fill of new batches
+    if DATE_COLUMN in df.columns:
+      df = df.drop(columns=DATE_COLUMN)
+    _, self.last_rows_ = carry_forward(df)
+
+  def _fill_batch(self, df):
+    if DATE_COLUMN in df.columns:
+      df = df.drop(columns=DATE_COLUMN)
+    if self.columns is None:
+      # First batch of a pipeline fitted only with partial_fit
+      self.columns = list(df.columns)
+      self.fill_values_ = df.mean().to_numpy()
+    filled, self.last_rows_ = carry_forward(df[self.columns], self.last_rows_,
+                                            self.fill_values_)
+    return self._select(filled, None)
+
+  def scale(self, df):
+    """Scaled features of a new batch of weeks."""
+    return self.scaler.transform(self._fill_batch(df))
+
+  def transform(self, df):
+    """PCA projection of a new batch of weeks."""
+    return self.pca.transform(self.scale(df))
+
+  def transform_features(self, features):
+    """Scaled features and projection of an already prepared frame."""
+    with stage('scale', features) as span:
+      scaled = self.scaler.transform(features)
+      span.output(scaled)
+    with stage('pca', scaled) as span:
+      projected = self.pca.transform(scaled)
+      span.output(projected)
+    return scaled, projected
+
+  def partial_fit(self, df):
+    """Update scaler and projection with a new batch of weeks."""
+    if self.pca is not None and not isinstance(self.pca, IncrementalPCA):
+      raise ValueError('partial_fit needs a pipeline built with incremental=True')
+    features = self._fill_batch(df)
+    if self.scaler is None:
+      self.scaler = preprocessing.MinMaxScaler()
+    self.scaler.partial_fit(features)
+    if self.pca is None:
+      self.incremental = True
+      self.pca = self._new_pca()
+    self.pca.partial_fit(self.scaler.transform(features))
+    return self
+
+  def save(self, path):
+    with open(path, 'wb') as fh:
+      pickle.dump(self, fh)
+
+  @classmethod
+  def load(cls, path):
+    with open(path, 'rb') as fh:
+      pipeline = pickle.load(fh)
+    if not isinstance(pipeline, cls):
+      raise TypeError('%s does not hold a %s' % (path, cls.__name__))
+    return pipeline
@@ -0,0 +1,157 @@
+"""Plots with a bounded payload, built without a browser.
+
+Every ``fig.show()`` in the notebook serializes all the points (or the whole
+n x n distance matrix) into the page. ``PointCloud`` keeps the projected
+coordinates once, chooses a bounded subset of them once, by random sampling
+or by a voxel grid, and draws every scatter from that same subset, so the
+plots stay comparable. ``distance_heatmap`` draws the tiled image of a
+``DistanceStore``. ``export_figures`` writes figures to static files instead
+of showing them.
+
+Plotly is only imported when a figure is built.
+"""
+
+import os
+
+import numpy as np
+
+from dengue.trace import traced
+
+# Points sent to a scatter plot at most
+MAX_POINTS = 20000
+
+# Cells per axis of the finest grid ``bin_points`` tries
+MAX_BINS = 2 ** 40
+
+AXIS_LABELS = {'0': 'PCA-1', '1': 'PCA-2', '2': 'PCA-3'}
+
+
+def sample_points(n, max_points=MAX_POINTS, groups=None, random_state=0):
+  """Sorted indices of at most ``max_points`` of ``n`` points.
+
+  With ``groups`` every group keeps a share of the sample proportional to
+  its size, and at least one point, so small clusters and the outliers
+  stay visible.
+  """
+  if n <= max_points:
+    return np.arange(n)
+  rng = np.random.RandomState(random_state)
+  if groups is None:
+    return np.sort(rng.choice(n, max_points, replace=False))
+  found, codes, sizes = np.unique(np.asarray(groups), return_inverse=True,
+                                 return_counts=True)
+  if len(found) >= max_points:
+    # No room for every group, one point of max_points groups at random
+    kept = rng.choice(len(found), max_points, replace=False)
+    shares = np.zeros(len(found), dtype=np.intp)
+    shares[kept] = 1
+  else:
+    shares = np.maximum(1, np.round(max_points * sizes / n).astype(np.intp))
+    shares = np.minimum(shares, sizes)
+    # Rounding up the small groups can go over max_points, the largest
+    # shares give the difference back
+    for _ in range(shares.sum() - max_points):
+      shares[shares.argmax()] -= 1
+  chosen = [rng.choice(np.flatnonzero(codes == g), share, replace=False)
+            for g, share in enumerate(shares) if share]
+  return np.sort(np.concatenate(chosen))
+
+
+def bin_points(points, max_points=MAX_POINTS):
+  """``(indices, counts)``: one point per occupied cell of a regular grid.
+
+  The grid is refined as long as it has no more occupied cells than
+  ``max_points``; ``counts`` tells how many points each kept one stands for.
+  When there are no more distinct points than ``max_points`` each of them
+  is kept once.
+  """
+  points = np.asarray(points, dtype=np.float64)
+  n = len(points)
+  if n <= max_points:
+    return np.arange(n), np.ones(n, dtype=np.intp)
+  _, first, counts = np.unique(points, axis=0, return_index=True,
+                               return_counts=True)
+  if len(first) <= max_points:
+    order = np.argsort(first)
+    return first[order], counts[order]
+  low = points.min(axis=0)
+  span = np.ptp(points, axis=0)
+  span[span == 0] = 1
+  unit = (points - low) / span
+  best = None
+  bins = 2
+  while True:
+    cells = np.minimum((unit * bins).astype(np.int64), bins - 1)
+    _, first, counts = np.unique(cells, axis=0, return_index=True,
+                                 return_counts=True)
+    if len(first) > max_points:
+      break
+    best = first, counts
+    if bins >= MAX_BINS:
+      # Points closer than the float resolution, the grid cannot split them
+      break
+    bins *= 2
+  if best is None:
+    # Even the coarsest grid is too fine, fall back to sampling
+    return sample_points(n, max_points), None
+  order = np.argsort(best[0])
+  return best[0][order], best[1][order]
+
+
+class PointCloud:
+  """Projected coordinates shared by all the scatter plots of a run."""
+
+  def __init__(self, points, max_points=MAX_POINTS, method='sample',
+               groups=None, random_state=0):
+    self.points = np.asarray(points)[:, :3]
+    self.counts = None
+    if method == 'sample':
+      self.index = sample_points(len(self.points), max_points, groups,
+                                 random_state)
+    elif method == 'bin':
+      self.index, self.counts = bin_points(self.points, max_points)
+    else:
+      raise ValueError("unknown method %r, use 'sample' or 'bin'" % (method,))
+
+  def __len__(self):
+    return len(self.index)
+
+  @traced('plotting')
+  def scatter(self, color=None, title=None, labels=AXIS_LABELS):
+    """3D scatter of the kept points, colored by a per-point value."""
+    import plotly.express as px
+    if color is not None:
+      color = np.asarray(color)[self.index]
+    return px.scatter_3d(self.points[self.index], x=0, y=1, z=2, color=color,
+                         title=title, labels=labels)
+
+
+@traced('plotting')
+def distance_heatmap(store, size=None, order=None, title=None):
+  """Heatmap of a ``DistanceStore``, averaged into at most size x size tiles."""
+  import plotly.express as px
+  from dengue.distances import HEATMAP_SIZE
+  image = store.heatmap(HEATMAP_SIZE if size is None else size, order=order)
+  return px.imshow(image, title=title)
+
+
+@traced('plotting')
+def export_figures(figures, directory, format='html'):
+  """Write every ``name -> figure`` to ``directory``; returns the paths.
+
+  HTML files load plotly.js from its CDN instead of embedding it. Other
+  formats (png, svg, pdf...) go through plotly's static image export for
+  plotly figures and ``savefig`` for matplotlib ones.
+  """
+  os.makedirs(directory, exist_ok=True)
+  paths = []
+  for name, figure in figures.items():
+    path = os.path.join(directory, '%s.%s' % (name, format))
+    if hasattr(figure, 'savefig'):
+      figure.savefig(path)
+    elif format == 'html':
+      figure.write_html(path, include_plotlyjs='cdn')
+    else:
+      figure.write_image(path)
+    paths.append(path)
+  return paths
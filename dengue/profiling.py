@@ -0,0 +1,88 @@
+"""Per-cluster profiles of the features in a single grouped pass.
+
+The notebook describes every clustering with one ``groupby('group').mean()``
+per feature family, each copying a subset of columns and regrouping from
+scratch, and names the groups with a Python call per row.
+``profile_clusters`` computes the count, mean, standard deviation and
+deviation from the overall mean of every feature at once, from two sparse
+products of a cluster indicator matrix with the feature array; the
+families are then column selections of the result. ``label_groups`` maps
+cluster ids to names as a categorical lookup.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from dengue.features import FEATURE_FAMILIES
+from dengue.trace import traced
+
+
+class ClusterProfile:
+  """``count``, ``mean``, ``std`` and ``deviation`` tables, one row per cluster."""
+
+  def __init__(self, count, mean, std, deviation):
+    self.count = count
+    self.mean = mean
+    self.std = std
+    self.deviation = deviation
+
+  def family(self, name, stat='mean'):
+    """One statistic restricted to a family of ``FEATURE_FAMILIES``."""
+    table = getattr(self, stat)
+    return table[[c for c in FEATURE_FAMILIES[name] if c in table.columns]]
+
+
+@traced('profiling')
+def profile_clusters(features, labels, columns=None):
+  """Profile of ``features`` (frame or array) grouped by ``labels``.
+
+  ``std`` uses one degree of freedom like pandas, and ``deviation`` is the
+  cluster mean minus the mean over all rows.
+  """
+  if isinstance(features, pd.DataFrame):
+    columns = list(features.columns) if columns is None else columns
+    X = features[columns].to_numpy(dtype=np.float64)
+  else:
+    X = np.asarray(features, dtype=np.float64)
+    columns = list(range(X.shape[1])) if columns is None else columns
+  codes, groups = pd.factorize(np.asarray(labels), sort=True)
+  n, k = len(X), len(groups)
+  overall = X.mean(axis=0)
+  # Centering first keeps the sums of squares accurate for large values
+  centered = X - overall
+  indicator = sparse.csr_matrix((np.ones(n), (codes, np.arange(n))),
+                                shape=(k, n))
+  count = np.asarray(indicator.sum(axis=1)).ravel()
+  sums = indicator @ centered
+  squares = indicator @ (centered ** 2)
+  deviation = sums / count[:, None]
+  with np.errstate(invalid='ignore', divide='ignore'):
+    variance = (squares - count[:, None] * deviation ** 2) / (count[:, None] - 1)
+  std = np.sqrt(np.maximum(variance, 0))
+  index = pd.Index(groups, name='group')
+  return ClusterProfile(
+      pd.Series(count.astype(np.int64), index=index, name='count'),
+      pd.DataFrame(deviation + overall, index=index, columns=columns),
+      pd.DataFrame(std, index=index, columns=columns),
+      pd.DataFrame(deviation, index=index, columns=columns))
+
+
+def label_groups(groups, names, default=None):
+  """Categorical of the names of ``groups`` (``names`` maps id -> name).
+
+  Groups missing from ``names`` get ``default``.
+  """
+  groups = np.asarray(groups)
+  categories = list(dict.fromkeys(names.values()))
+  if default is not None and default not in categories:
+    categories.append(default)
+  ids = np.array(list(names))
+  name_codes = np.array([categories.index(names[i]) for i in ids])
+  order = np.argsort(ids)
+  ids, name_codes = ids[order], name_codes[order]
+  at = np.clip(np.searchsorted(ids, groups), 0, len(ids) - 1)
+  found = ids[at] == groups
+  fallback = -1 if default is None else categories.index(default)
+  codes = np.where(found, name_codes[at], fallback)
+  return pd.Categorical.from_codes(codes, categories)
@@ -0,0 +1,94 @@
+"""PCA that only computes the components it keeps.
+
+The notebook fits ``PCA()`` with every component and then uses the first 3,
+the ones that explain about 80% of the variance. ``TruncatedProjection``
+takes either a number of components or a target explained-variance fraction
+and uses a randomized (or ARPACK) solver for just that many components. For
+a variance target it starts small and doubles the number of components
+until the target is reached, so on wide feature sets only a fraction of the
+spectrum is ever computed.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+
+# Components computed on the first try when looking for a variance target
+FIRST_GUESS = 4
+
+
+def loadings(pca, feature_names, n_components=None):
+  """Loadings table of the first components, one column per component."""
+  components = pca.components_[:n_components]
+  return pd.DataFrame(components.T, index=feature_names,
+                      columns=['PC-%d' % (i + 1) for i in range(len(components))])
+
+
+class TruncatedProjection:
+  """PCA limited to ``n_components`` or to a fraction of the variance.
+
+  Exposes the attributes of ``sklearn.decomposition.PCA`` the notebook uses
+  (``components_``, ``explained_variance_ratio_``, ``transform``...), so it
+  can stand in for it. ``dtype`` sets the type of the projected matrix,
+  e.g. float32 to halve the memory it takes.
+  """
+
+  def __init__(self, n_components=None, variance=None, svd_solver='randomized',
+               random_state=0, dtype=None):
+    if (n_components is None) == (variance is None):
+      raise ValueError('set exactly one of n_components and variance')
+    if variance is not None and not 0 < variance <= 1:
+      raise ValueError('variance must be a fraction in (0, 1], got %r'
+                       % (variance,))
+    self.n_components = n_components
+    self.variance = variance
+    self.svd_solver = svd_solver
+    self.random_state = random_state
+    self.dtype = dtype
+
+  def _limit(self, X):
+    # ARPACK cannot compute the full spectrum
+    limit = min(X.shape)
+    return limit - 1 if self.svd_solver == 'arpack' else limit
+
+  def _pca(self, k):
+    return PCA(k, svd_solver=self.svd_solver, random_state=self.random_state)
+
+  def fit(self, X):
+    X = np.asarray(X)
+    limit = self._limit(X)
+    if self.n_components is not None:
+      pca = self._pca(min(self.n_components, limit)).fit(X)
+      keep = pca.n_components_
+    else:
+      k = min(FIRST_GUESS, limit)
+      while True:
+        pca = self._pca(k).fit(X)
+        reached = np.cumsum(pca.explained_variance_ratio_)
+        if reached[-1] >= self.variance or k == limit:
+          break
+        k = min(2 * k, limit)
+      keep = min(int(np.searchsorted(reached, self.variance)) + 1, k)
+    self.mean_ = pca.mean_
+    self.components_ = pca.components_[:keep]
+    self.explained_variance_ = pca.explained_variance_[:keep]
+    self.explained_variance_ratio_ = pca.explained_variance_ratio_[:keep]
+    self.singular_values_ = pca.singular_values_[:keep]
+    self.n_components_ = keep
+    self.n_features_in_ = X.shape[1]
+    return self
+
+  def transform(self, X):
+    projected = (np.asarray(X) - self.mean_) @ self.components_.T
+    if self.dtype is not None:
+      projected = projected.astype(self.dtype, copy=False)
+    return projected
+
+  def fit_transform(self, X):
+    return self.fit(X).transform(X)
+
+  def inverse_transform(self, X):
+    return np.asarray(X) @ self.components_ + self.mean_
+
+  def loadings(self, feature_names, n_components=None):
+    return loadings(self, feature_names, n_components)
@@ -0,0 +1,187 @@
+"""Stability of the K-means and hierarchical groups under resampling.
+
+The number of groups was chosen from one SSE/silhouette curve and one
+dendrogram. ``cluster_stability`` refits the same configuration on
+bootstrap samples or subsamples of the weeks, spread over a process pool,
+and counts for every pair of weeks how often both were drawn and how often
+they fell in the same group. The counts are integer matrices updated one
+block of rows at a time, one group at a time, so each refit adds its
+co-clustered pairs without building an m x m temporary. The result reports
+how well every group of the full fit is recovered (mean Jaccard
+similarity, as in Hennig's clusterboot) and gives a consensus labelling
+from the co-association matrix.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.cluster import hierarchy
+from scipy.spatial.distance import squareform
+from sklearn.cluster import KMeans
+
+from dengue.distances import BLOCK_ROWS
+from dengue.hierarchy import linkage_from_features
+from dengue.kmeans import KMEANS_PARAMS
+from dengue.trace import traced
+
+STABILITY_METHODS = ('kmeans', 'hierarchical')
+
+_worker_X = None
+
+
+def _init_worker(X):
+  global _worker_X
+  _worker_X = X
+
+
+def _resample(n, fraction, bootstrap, seed):
+  rng = np.random.RandomState(seed)
+  if bootstrap:
+    # Drawn with replacement; each week counts once in the refit
+    return np.unique(rng.randint(0, n, n))
+  return np.sort(rng.choice(n, max(2, int(round(fraction * n))), replace=False))
+
+
+def _cluster(X, method, k, params, seed):
+  if method == 'kmeans':
+    return KMeans(k, **dict(params, random_state=seed)).fit_predict(X)
+  clusters = linkage_from_features(X, params.get('linkage', 'complete'))
+  return hierarchy.fcluster(clusters, k, criterion='maxclust')
+
+
+def _fit_worker(args):
+  method, k, params, fraction, bootstrap, seed = args
+  rows = _resample(len(_worker_X), fraction, bootstrap, seed)
+  labels = _cluster(_worker_X[rows], method, k, params, seed)
+  return rows, np.unique(labels, return_inverse=True)[1]
+
+
+def add_coassociation(together, sampled, rows, labels, block_rows=BLOCK_ROWS):
+  """Count the pairs of ``rows`` as drawn, and as co-clustered by ``labels``."""
+  for start in range(0, len(rows), block_rows):
+    sampled[np.ix_(rows[start:start + block_rows], rows)] += 1
+  order = np.argsort(labels, kind='stable')
+  bounds = np.flatnonzero(np.diff(labels[order])) + 1
+  for members in np.split(rows[order], bounds):
+    for start in range(0, len(members), block_rows):
+      together[np.ix_(members[start:start + block_rows], members)] += 1
+
+
+def _jaccard(reference, rows, labels, k):
+  # Best Jaccard similarity of every reference group with a refit group
+  table = np.zeros((k, labels.max() + 1))
+  np.add.at(table, (reference[rows], labels), 1)
+  union = table.sum(axis=1)[:, None] + table.sum(axis=0)[None, :] - table
+  with np.errstate(invalid='ignore', divide='ignore'):
+    best = (table / union).max(axis=1)
+  best[table.sum(axis=1) == 0] = np.nan
+  return best
+
+
+class ClusterStability:
+  """Co-association counts and group recovery over the refits.
+
+  ``reference`` numbers the groups of the full fit 0..k-1 and ``groups``
+  holds the ids the fit gave them, as ``fcluster`` or ``KMeans`` returned.
+  """
+
+  def __init__(self, reference, together, sampled, jaccard, groups=None):
+    self.reference = reference
+    self.together = together
+    self.sampled = sampled
+    self.jaccard = jaccard
+    self.groups = (np.arange(jaccard.shape[1]) if groups is None
+                   else np.asarray(groups))
+
+  @property
+  def n_resamples(self):
+    return len(self.jaccard)
+
+  def coassociation(self):
+    """Fraction of the refits drawing both weeks that grouped them together."""
+    ratio = np.zeros(self.together.shape, dtype=np.float32)
+    np.divide(self.together, self.sampled, out=ratio, where=self.sampled > 0)
+    return ratio
+
+  def stability(self):
+    """Mean Jaccard recovery of every group of the full fit."""
+    return np.nanmean(self.jaccard, axis=0)
+
+  def table(self):
+    """``[group, size, jaccard, coassociation]`` rows, ready for ``tabulate``.
+
+    ``group`` is the id the full fit gave the group. ``coassociation`` is
+    the mean co-association of the pairs of weeks inside the group.
+    """
+    ratio = self.coassociation()
+    rows = []
+    for group, (name, jaccard) in enumerate(zip(self.groups.tolist(),
+                                                self.stability())):
+      members = np.flatnonzero(self.reference == group)
+      size = len(members)
+      inside = ratio[np.ix_(members, members)].sum() - ratio[members, members].sum()
+      pairs = size * (size - 1)
+      rows.append([name, size, jaccard, inside / pairs if pairs else np.nan])
+    return rows
+
+  def consensus(self, k=None, method='average'):
+    """Labels of the weeks cut from a linkage of 1 - co-association."""
+    k = len(self.jaccard[0]) if k is None else k
+    distance = 1 - self.coassociation()
+    np.fill_diagonal(distance, 0)
+    clusters = hierarchy.linkage(squareform(distance, checks=False),
+                                 method=method)
+    return hierarchy.fcluster(clusters, k, criterion='maxclust')
+
+
+@traced('stability')
+def cluster_stability(X, method='kmeans', k=3, n_resamples=100, fraction=0.8,
+                      bootstrap=False, n_jobs=None, random_state=0,
+                      block_rows=BLOCK_ROWS, **params):
+  """``ClusterStability`` of ``method`` refitted with ``k`` groups.
+
+  The configuration is refitted ``n_resamples`` times, each time on a
+  subsample of ``fraction`` of the rows, or with ``bootstrap`` on a sample
+  drawn with replacement. ``n_jobs`` sets the size of the process pool
+  (``None`` refits in this process). ``params`` override ``KMEANS_PARAMS``,
+  or give the ``linkage`` of the hierarchical method.
+  """
+  if method not in STABILITY_METHODS:
+    raise ValueError('unknown method %r, use one of %s'
+                     % (method, ', '.join(STABILITY_METHODS)))
+  if method == 'kmeans':
+    params = dict(KMEANS_PARAMS, **params)
+  X = np.asarray(X)
+  n = len(X)
+  groups, reference = np.unique(_cluster(X, method, k, params, random_state),
+                                return_inverse=True)
+  seeds = np.random.RandomState(random_state).randint(2 ** 31 - 1,
+                                                      size=n_resamples)
+  tasks = [(method, k, params, fraction, bootstrap, seed) for seed in seeds]
+
+  dtype = np.uint16 if n_resamples < 2 ** 16 else np.uint32
+  together = np.zeros((n, n), dtype=dtype)
+  sampled = np.zeros((n, n), dtype=dtype)
+  n_found = len(groups)
+  jaccard = np.empty((n_resamples, n_found))
+
+  def accumulate(fits):
+    # Counted as the refits come back, while the pool goes on
+    for i, (rows, labels) in enumerate(fits):
+      add_coassociation(together, sampled, rows, labels, block_rows)
+      jaccard[i] = _jaccard(reference, rows, labels, n_found)
+
+  if n_jobs is not None and n_jobs != 1:
+    workers = n_jobs if n_jobs > 0 else os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(X,)) as pool:
+      chunksize = max(1, n_resamples // (4 * workers))
+      accumulate(pool.map(_fit_worker, tasks, chunksize=chunksize))
+  else:
+    _init_worker(X)
+    try:
+      accumulate(map(_fit_worker, tasks))
+    finally:
+      _init_worker(None)
+  return ClusterStability(reference, together, sampled, jaccard, groups)
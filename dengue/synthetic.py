@@ -0,0 +1,89 @@
+"""Synthetic weekly climate frames shaped like the DengAI features.
+
+``synthetic_features`` builds frames of any size with the same 20 feature
+columns and ``city/weekofyear/year`` index as ``dengue_features_train``.
+Every city gets its own climate: yearly temperature and rain cycles around
+city-specific means, features of the same family moving together, and
+missing values scattered at random. It is meant for timing the pipeline at
+sizes the real data does not reach, not for drawing conclusions.
+"""
+
+import numpy as np
+import pandas as pd
+
+from dengue.features import FEATURE_COLUMNS, INDEX_FIELDS
+
+WEEKS = 52
+
+FIRST_YEAR = 1990
+
+# (mean, spread, loading on temperature, rain, vegetation) of every feature
+_FEATURE_MODEL = {
+  'ndvi_ne': (0.14, 0.05, 0.0, 0.2, 1.0),
+  'ndvi_nw': (0.13, 0.05, 0.0, 0.2, 1.0),
+  'ndvi_se': (0.20, 0.04, 0.0, 0.1, 0.8),
+  'ndvi_sw': (0.20, 0.04, 0.0, 0.1, 0.8),
+  'precipitation_amt_mm': (35.0, 40.0, 0.2, 1.0, 0.1),
+  'reanalysis_air_temp_k': (299.0, 1.3, 1.0, 0.1, 0.0),
+  'reanalysis_avg_temp_k': (299.2, 1.2, 1.0, 0.1, 0.0),
+  'reanalysis_dew_point_temp_k': (295.0, 1.5, 0.9, 0.4, 0.0),
+  'reanalysis_max_air_temp_k': (301.4, 1.3, 0.9, 0.0, 0.0),
+  'reanalysis_min_air_temp_k': (297.3, 1.3, 0.9, 0.1, 0.0),
+  'reanalysis_precip_amt_kg_per_m2': (30.0, 35.0, 0.1, 0.9, 0.0),
+  'reanalysis_relative_humidity_percent': (78.5, 3.5, -0.2, 0.7, 0.0),
+  'reanalysis_sat_precip_amt_mm': (35.0, 40.0, 0.2, 1.0, 0.1),
+  'reanalysis_specific_humidity_g_per_kg': (16.5, 1.6, 0.9, 0.4, 0.0),
+  'reanalysis_tdtr_k': (2.5, 0.5, 0.1, -0.6, 0.0),
+  'station_avg_temp_c': (27.0, 1.4, 1.0, 0.0, 0.0),
+  'station_diur_temp_rng_c': (6.8, 0.8, 0.2, -0.5, 0.0),
+  'station_max_temp_c': (31.6, 1.7, 0.9, 0.0, 0.0),
+  'station_min_temp_c': (22.6, 1.5, 0.9, 0.1, 0.0),
+  'station_precip_mm': (26.0, 29.0, 0.1, 0.9, 0.1),
+}
+
+
+def synthetic_features(n_rows, years_per_city=20, missing=0.01,
+                       random_state=0):
+  """Frame of ``n_rows`` weekly records with missing values injected.
+
+  Cities are filled ``years_per_city`` years at a time, starting with
+  ``sj`` and ``iq``; feature columns are float32 and ``city`` is
+  categorical, as ``dengue.loading.read_features`` returns them.
+  """
+  rng = np.random.RandomState(random_state)
+  per_city = years_per_city * WEEKS
+  n_cities = max(1, -(-n_rows // per_city))
+  names = ['sj', 'iq'] + ['c%04d' % i for i in range(max(0, n_cities - 2))]
+  names = names[:n_cities]
+
+  row = np.arange(n_rows)
+  city = row // per_city
+  year = FIRST_YEAR + (row % per_city) // WEEKS
+  week = 1 + row % WEEKS
+
+  # City climate: offsets of the means and phase of the seasons
+  offset = rng.normal(0, 0.5, size=(n_cities, 3))
+  phase = rng.uniform(0, 2 * np.pi, size=n_cities)
+  season = 2 * np.pi * week / WEEKS + phase[city]
+  temperature = np.sin(season) + offset[city, 0] + 0.4 * rng.normal(size=n_rows)
+  rain = (np.sin(season - 1.0) + offset[city, 1]
+          + 0.8 * rng.standard_exponential(size=n_rows) - 0.8)
+  vegetation = 0.5 * rain + offset[city, 2] + 0.7 * rng.normal(size=n_rows)
+
+  columns = {}
+  for name in FEATURE_COLUMNS:
+    mean, spread, t, r, v = _FEATURE_MODEL[name]
+    values = (t * temperature + r * rain + v * vegetation
+              + 0.3 * rng.normal(size=n_rows))
+    values = mean + spread * values
+    if name.endswith('_mm') or name.endswith('_m2'):
+      values = np.maximum(values, 0)
+    values[rng.random_sample(n_rows) < missing] = np.nan
+    columns[name] = values.astype(np.float32)
+
+  index = pd.MultiIndex.from_arrays([
+    pd.Categorical.from_codes(city, names),
+    week.astype(np.int16),
+    year.astype(np.int16),
+  ], names=INDEX_FIELDS)
+  return pd.DataFrame(columns, index=index, columns=FEATURE_COLUMNS)
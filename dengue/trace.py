@@ -0,0 +1,216 @@
+"""Timing and memory instrumentation of the analysis stages.
+
+Each stage of the package (load, drop, impute, filter, scale, PCA,
+neighbours, DBSCAN, K-means, hierarchy, plotting) runs inside a span of the
+module tracer. A span records wall time, CPU time, the peak RSS of the
+process when it ends and the shape and size of its input and output arrays.
+Spans can be written as JSON lines or as a Chrome trace event file, which
+opens in Perfetto, chrome://tracing or speedscope as a timeline/flamegraph.
+
+Tracing is off by default; a disabled stage costs one attribute lookup.
+Turn it on with ``enable()`` or by setting ``DENGUE_TRACE`` to the path of
+the trace file to write when the process exits (``.jsonl`` for the log,
+anything else for the Chrome format).
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+  import resource
+except ImportError:  # Windows
+  resource = None
+
+TRACE_ENV = 'DENGUE_TRACE'
+
+
+def peak_rss_bytes():
+  """Largest resident set size of the process so far, if known."""
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, macOS bytes
+  return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def describe(obj):
+  """Shape and size in bytes of an array, frame or tuple of them."""
+  if isinstance(obj, (tuple, list)) and obj and hasattr(obj[0], 'shape'):
+    return [describe(item) for item in obj if hasattr(item, 'shape')]
+  shape = getattr(obj, 'shape', None)
+  if shape is None:
+    return None
+  info = {'shape': list(shape)}
+  nbytes = getattr(obj, 'nbytes', None)
+  if nbytes is None and hasattr(obj, 'memory_usage'):
+    nbytes = obj.memory_usage(index=False).sum()
+  if nbytes is not None:
+    info['nbytes'] = int(nbytes)
+  return info
+
+
+class Span:
+  """One run of a stage."""
+
+  def __init__(self, tracer, name, inputs=None):
+    self.tracer = tracer
+    self.name = name
+    self.record = {'name': name}
+    if inputs is not None:
+      self.record['input'] = describe(inputs)
+
+  def output(self, obj):
+    """Record the size of what the stage produced."""
+    self.record['output'] = describe(obj)
+
+  def __enter__(self):
+    self.record['depth'] = self.tracer._enter()
+    self.record['thread'] = threading.get_ident()
+    self._wall = time.perf_counter()
+    self._cpu = time.process_time()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.record['wall_seconds'] = time.perf_counter() - self._wall
+    self.record['cpu_seconds'] = time.process_time() - self._cpu
+    self.record['start'] = self._wall - self.tracer.origin
+    self.record['peak_rss_bytes'] = peak_rss_bytes()
+    if exc_type is not None:
+      self.record['error'] = exc_type.__name__
+    self.tracer._exit()
+    self.tracer.spans.append(self.record)
+    return False
+
+
+class _NullSpan:
+  # Shared by every stage while tracing is off
+
+  def output(self, obj):
+    pass
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+  """Collects the spans of the stages run while it is enabled."""
+
+  def __init__(self, enabled=False):
+    self.enabled = enabled
+    self.spans = []
+    self.origin = time.perf_counter()
+    self._depth = threading.local()
+
+  def _enter(self):
+    depth = getattr(self._depth, 'value', 0)
+    self._depth.value = depth + 1
+    return depth
+
+  def _exit(self):
+    self._depth.value -= 1
+
+  def stage(self, name, inputs=None):
+    """Context manager around a stage; ``inputs`` is sized when tracing."""
+    if not self.enabled:
+      return NULL_SPAN
+    return Span(self, name, inputs)
+
+  def clear(self):
+    self.spans = []
+    self.origin = time.perf_counter()
+
+  def summary(self):
+    """``[stage, calls, wall, cpu]`` rows: calls and total time per stage."""
+    totals = {}
+    for span in self.spans:
+      calls, wall, cpu = totals.get(span['name'], (0, 0.0, 0.0))
+      totals[span['name']] = (calls + 1, wall + span['wall_seconds'],
+                              cpu + span['cpu_seconds'])
+    return [[name, calls, wall, cpu]
+            for name, (calls, wall, cpu) in totals.items()]
+
+  def write_jsonl(self, path):
+    """One JSON record per span."""
+    with open(path, 'w') as fh:
+      for span in self.spans:
+        fh.write(json.dumps(span) + '\n')
+
+  def write_chrome_trace(self, path):
+    """Chrome trace event file (Perfetto, chrome://tracing, speedscope)."""
+    pid = os.getpid()
+    events = []
+    for span in self.spans:
+      args = {key: span[key] for key in
+              ('input', 'output', 'cpu_seconds', 'peak_rss_bytes', 'error')
+              if span.get(key) is not None}
+      events.append({
+        'name': span['name'], 'ph': 'X', 'pid': pid, 'tid': span['thread'],
+        'ts': span['start'] * 1e6, 'dur': span['wall_seconds'] * 1e6,
+        'args': args,
+      })
+    with open(path, 'w') as fh:
+      json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fh)
+
+  def write(self, path):
+    """JSON lines for ``.jsonl`` paths, Chrome trace events otherwise."""
+    if path.endswith('.jsonl'):
+      self.write_jsonl(path)
+    else:
+      self.write_chrome_trace(path)
+
+
+TRACER = Tracer()
+
+
+def enable(path=None):
+  """Turn tracing on; with ``path`` the trace is written at exit."""
+  TRACER.enabled = True
+  if path is not None:
+    atexit.register(TRACER.write, path)
+  return TRACER
+
+
+def disable():
+  TRACER.enabled = False
+
+
+def stage(name, inputs=None):
+  """``TRACER.stage``."""
+  return TRACER.stage(name, inputs)
+
+
+def _first_array(args):
+  for arg in args:
+    if hasattr(arg, 'shape'):
+      return arg
+  return None
+
+
+def traced(name):
+  """Decorator running the function as the stage ``name``."""
+  def decorate(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      if not TRACER.enabled:
+        return func(*args, **kwargs)
+      with TRACER.stage(name, _first_array(args)) as span:
+        result = func(*args, **kwargs)
+        span.output(result)
+      return result
+    return wrapper
+  return decorate
+
+
+if os.environ.get(TRACE_ENV):
+  enable(os.environ[TRACE_ENV])
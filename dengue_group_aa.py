@@ -24,6 +24,25 @@ Prior to starting any analysis, it is necessary to ensure that the basic and gen
 # Data load and manipulation
 from google.colab import files
 import io
+from dengue.loading import read_features
+from dengue.filtering import filter_city_years
+from dengue.cities import run_cities, REPORT_HEADERS
+from dengue.stability import cluster_stability
+from dengue.correlation import (correlation_frame, rolling_correlations,
+                                redundancy_groups)
+from dengue.neighbors import k_distances, knee_point
+from dengue.outliers import DBSCANSweep
+from dengue.kmeans import kmeans_sweep
+from dengue.hierarchy import linkage_from_features, dendrogram_cuts
+from dengue.distances import DistanceStore
+from dengue.imputation import impute
+from dengue.pipeline import DenguePipeline
+from dengue.reduction import loadings
+from dengue.profiling import profile_clusters, label_groups
+from dengue.features import FEATURE_COLUMNS
+from dengue.plots import PointCloud, distance_heatmap
+from dengue import trace
+from dengue.cache import StageCache
 
 # DataFrame librery
 import pandas as pd
@@ -37,24 +56,23 @@ from tabulate import tabulate
 # Basic Operations
 import numpy as np
 import itertools
-from numpy import corrcoef, transpose, arange
+from numpy import arange
 from pylab import pcolor, show, colorbar, xticks, yticks
 
-# Prepocessing
-from sklearn import preprocessing 
-from sklearn.impute import KNNImputer
+# Stage timings, see the last section (setting DENGUE_TRACE=trace.json in
+# the environment also writes a trace file for a timeline viewer)
+trace.enable()
+
+# Results of the expensive stages are kept on disk, keyed by their inputs,
+# so changing a parameter further down only recomputes what depends on it
+stage_cache = StageCache('.dengue_cache')
 
 # Models
-from sklearn import metrics
-from sklearn.cluster import KMeans
 from scipy import cluster
-from sklearn.decomposition import PCA
-from sklearn import neighbors
-from sklearn.cluster import DBSCAN
 
 """# Data Loading
 
-First of all we load the data into the environment with the functionalities that Google Colab allows us.
+First of all we load the data into the environment with the functionalities that Google Colab allows us. The uploaded bytes are parsed in chunks by `read_features`, with float32 features and a categorical city, instead of being decoded into a second string copy. Outside Colab, `read_features` also takes a local path and can keep a Parquet/npz cache of the parsed frame.
 """
 
 def upload_files (index_fields):
@@ -62,7 +80,7 @@ def upload_files (index_fields):
   for fn in uploaded.keys():
     print('User uploaded file "{name}" with length {length} bytes'.format(
         name=fn, length=len(uploaded[fn])))
-    df = pd.read_csv(io.StringIO(uploaded[fn].decode('utf-8')), index_col = index_fields)
+    df = read_features(io.BytesIO(uploaded[fn]), index_fields)
     return df
 
 """The first thing we do is upload the training data without a target field (dengue_features_train). Using pandas library you can explore the data, to set filters and grouping operations."""
@@ -86,42 +104,33 @@ train.head()
 
 pd.isnull(train).any()
 
-"""We can process them automatically by completing them with the ffill method (with the previous value). If the data is organized chronologically it can be a very fast and useful method. But this time we have chosen to calculate the mean among the five nearest values."""
+"""We can process them automatically by completing them with the ffill method (with the previous value). If the data is organized chronologically it can be a very fast and useful method. But this time we have chosen to calculate the mean among the five nearest values, looking for them among all the weeks of the dataset as the original `KNNImputer` cell did, so the outliers and groups below are unchanged (`by_city=True` would look only among the weeks of the same city). `dengue.imputation` also offers the chronological path (`'interpolate'`, `'ffill'`) and a KD-tree based `'knn'`; `compare_imputers` measures their runtime and error on values hidden on purpose."""
 
-imputer = KNNImputer(n_neighbors=5)
-train[:] = imputer.fit_transform(train)
+train = stage_cache.run('impute', impute, train, method='knn_exact',
+                        by_city=False, n_neighbors=5)
 
 pd.isnull(train).any()
 
 """# Filtering
 
-We move on to the filtering stage where we will reduce the datasets to the records with city of origin "San Juan", localizated in the dataset like 'sj'. And the records between 1990 and 1996
+We move on to the filtering stage where we will reduce the datasets to the records with city of origin "San Juan", localizated in the dataset like 'sj'. And the records between 1990 and 1996. The selection is made with masks over the index levels; `partition_by_city` from `dengue.filtering` can be used instead when several cities are going to be analyzed.
 """
 
-train_sj = train.loc['sj']
-
-index_list = []
-for i in train_sj.index:
-  (_, y) = i
-  if y >= 1990 and y <=1996:
-    index_list.append(i)
-train_filtered = train_sj.loc[index_list]
+train_filtered = filter_city_years(train, 'sj', (1990, 1996))
 train_filtered
 
 """# Dimensionality Reduction
 
-First of all, we are going to extract the correlation among features, to obtain some conclusions. That we make with corrcoef method.
+First of all, we are going to extract the correlation among features, to obtain some conclusions. `correlation_frame` computes it from running sums over the weeks, without transposing the data.
 """
 
-df_features = transpose(train_filtered)
-names = df_features.index.values
-df_features.head()
-
-correlation = corrcoef(df_features)
+correlation = correlation_frame(train_filtered)
+names = correlation.columns.values
+correlation.head()
 
 # Generate a mask for the upper triangle
 sns.set(style="white")
-mask = np.zeros_like(correlation, dtype=np.bool)
+mask = np.zeros(correlation.shape, dtype=bool)
 mask[np.triu_indices_from(mask)] = True
 
 # Set up the matplotlib figure
@@ -141,14 +150,28 @@ sns.heatmap(correlation, mask=mask, cmap=cmap, vmax=.8,
 - The features related to precipitation are highly correlated (precipitation_amt_mm, reanalysis_sat_precip_amt_mm and station_precip_mm)
 - The relative humidity percent is inversely correlated with the thermal amplitude (reanalysis_tdtr_k) and the diurn temperature range (station_diur_temp_rng_c).
 
-Normalize data, and execute PCA procedure to reduce dimensionality of the data.
+The groups of strongly correlated features can also be listed directly, linking every pair of features with an absolute correlation of at least 0.8.
+"""
+
+redundancy_groups(correlation, 0.8)
+
+"""To check whether these groups hold over time and in the other cities, the correlation is computed over windows of 5 years, moving one year at a time. From one window to the next only the weeks of the year that leaves are removed from the running sums and those of the year that enters are added."""
+
+window_correlations = rolling_correlations(train, width = 5, step = 1)
+pd.Series({window: redundancy_groups(corr, 0.8)
+           for window, corr in window_correlations.items()})
+
+"""Normalize data, and execute PCA procedure to reduce dimensionality of the data. The scaler and the PCA are kept in a `DenguePipeline`, which can be saved and used later to project new weeks without refitting.
 """
 
-scaler = preprocessing.MinMaxScaler()
-dengue_train = scaler.fit_transform(train_filtered)
+pipeline = DenguePipeline(city='sj', years=(1990, 1996))
+pipeline.fit_features(train_filtered)
+scaler, pca = pipeline.scaler, pipeline.pca
+dengue_train, X_pca = pipeline.transform_features(train_filtered)
 
-pca = PCA ()
-X_pca = pca.fit_transform(dengue_train)
+# The 3 first components, shared by every scatter plot; above MAX_POINTS
+# weeks only a sample of them is drawn
+cloud = PointCloud(X_pca)
 X_pca.shape
 
 """We show the percentage of variance explained by each of the selected components."""
@@ -160,9 +183,9 @@ px.area(
     y=exp_var_cumul,
     labels={"x": "# Components", "y": "Explained Variance"})
 
-"""We decided to use 3 components to reduce the dimensionality of the data, so we can plot it in a 3D Scatter. This way, we keep almost the 80% of explained variance of the data ."""
+"""We decided to use 3 components to reduce the dimensionality of the data, so we can plot it in a 3D Scatter. This way, we keep almost the 80% of explained variance of the data . On wider data, `DenguePipeline(variance=0.8)` (or `n_components=3, svd_solver='randomized'`) computes only the components that are kept, with a randomized solver; `n_components=3` alone fits a plain `PCA(3)`."""
 
-pd.DataFrame(np.matrix.transpose(pca.components_[:3, :]), columns=['PC-1', 'PC-2', 'PC-3'], index=train_filtered.columns)
+loadings(pca, train_filtered.columns, 3)
 
 """The first component (PC-1) is linearly related with te following features:
   - reanalysis_air_temp_k
@@ -197,11 +220,7 @@ We can say that this component is highly related to the vegetation features, but
 We plot the results.
 """
 
-fig = px.scatter_3d(
-    X_pca[:, :3], x=0, y=1, z=2,
-    title='Data Visualization by PCA with 3 components',
-    labels = {'0':'PCA-1', '1':'PCA-2','2':'PCA-3'}
-)
+fig = cloud.scatter(title='Data Visualization by PCA with 3 components')
 fig.show()
 
 """# Outlier Identification
@@ -209,12 +228,12 @@ fig.show()
 We compute the similarity matrix of the data, and we plot it. We saw that it looked like a chess board, this can be because the weeks are more similar to weeks from the same month/station of other year, than from weeks from the same year but different month/station. This really have sense, and makes a beautiful pattern on the matrix.
 """
 
-# We define euclidean distance as metric for compute the matrix
-distance = neighbors.DistanceMetric.get_metric('euclidean')
-similarity_matrix = distance.pairwise(dengue_train)
+# We compute the euclidean distance matrix by blocks of rows. For long
+# histories, dtype=np.float32 and a path keep it in a file on disk.
+similarity_matrix = DistanceStore(dengue_train)
 
-# Plot the matrix
-fig = px.imshow(similarity_matrix)
+# Plot the matrix, averaged into tiles when there are many weeks
+fig = distance_heatmap(similarity_matrix)
 fig.show()
 
 """Once we got the similarity matrix, we use DBSCAN to classify the data and identify the outliers. For the parameterization, due to the lack of an expert in the domain, we used the ln(n) heuristic approachOn to set the minPts of the algorithm, where n is the total number of points to be clustered (347 in our case). 
@@ -225,18 +244,12 @@ Then, we compute the distance from each point to its neighbors and plot the sort
 # We set minPts to ln(347) (Aprox. 6)
 minPts=6
 
-# We compute the distance from each point to its neighbors
-dist_to_neighbor = neighbors.kneighbors_graph(dengue_train, minPts, include_self=False)
-distneigh_array = dist_to_neighbor.toarray()
+# We compute the sorted distance of every point to its kth nearest neighbor
+# with a KD-tree query, without building the dense neighbors graph
+seq = k_distances(dengue_train, minPts)
 
-# We sort the distance of every point to its kth nearest neighbor
-seq = []
-for i,s in enumerate(dengue_train):
-    for j in range(len(dengue_train)):
-        if distneigh_array[i][j] != 0:
-            seq.append(similarity_matrix[i][j])
-            
-seq.sort()
+# The elbow of the curve is a first guess for eps
+print('Suggested eps: %.3f' % seq[knee_point(seq)])
 
 # Plot 
 fig = px.line(x=np.arange(0, len(seq), 1), y=seq)
@@ -244,36 +257,31 @@ fig.show()
 
 """We choose to try different clusters from 0.5 to 0.8 with intervals of 0.5."""
 
-results = []
+eps_values = np.arange(0.5, 0.8, 0.05)
 
-# Try different clusters with different eps parameter
-for eps in np.arange(0.5, 0.8, 0.05):
-  db = DBSCAN(eps, min_samples=minPts).fit(dengue_train)
-
-  core_samples_mask = np.zeros_like(db.labels_, dtype=bool)
-  core_samples_mask[db.core_sample_indices_] = True
-  labels = db.labels_
-  n_clusters_ = len(set(labels)) - (1 if -1 in labels else 0)
-  n_outliers = list(labels).count(-1)
-  results.append([eps, n_clusters_, n_outliers])
+# The core distances and the spanning tree of the weeks are computed once,
+# and every eps is labelled from them instead of refitting DBSCAN
+sweep = DBSCANSweep(dengue_train, eps_values.max(), min_samples=minPts)
+results, sweep_labels = sweep.sweep(eps_values)
 
 # We print the results
 print(tabulate(results, headers = ("eps", "clusters", "outliers")))
 
-"""We are going to keep the settings that offer a balanced numbre between outliers and groups, so we use 0.65 as eps parameter for the DBSCAN algorithm."""
+"""We are going to keep the settings that offer a balanced numbre between outliers and groups, so we use 0.65 as eps parameter for the DBSCAN algorithm. The labels come from the same neighbourhoods computed for the sweep, and are the ones `DBSCAN(eps=0.65, min_samples=minPts)` would give."""
 
-db = DBSCAN(eps=0.65, min_samples=minPts).fit(dengue_train)
-labels = db.labels_
+labels = sweep.labels(0.65)
 labels
 
+"""The core samples of this labelling are kept in a KD-tree. New weeks, scaled by the same pipeline, are then flagged without refitting DBSCAN: a week with no core point within `eps` is an outlier. The model can be saved with `outlier_model.save(path)` and reloaded with `OutlierModel.load(path)`."""
+
+outlier_model = sweep.outlier_model(0.65)
+# The weeks of the history are flagged as DBSCAN flags them
+(outlier_model.is_outlier(dengue_train) == (labels == -1)).all()
+
 """Once we identify outliers, we plot it on a 3D scatter."""
 
-fig = px.scatter_3d(
-    X_pca[:, :3], x=0, y=1, z=2,
-    color=labels,
-    title='Outlier Identification on PCA with 3 components',
-    labels = {'0':'PCA-1', '1':'PCA-2','2':'PCA-3'}
-)
+fig = cloud.scatter(color = labels,
+                    title='Outlier Identification on PCA with 3 components')
 fig.show()
 
 """After identify the outliers, we analyze thy these elements are outliers in order to decide whether or not consider them for further analysis."""
@@ -312,11 +320,13 @@ train_filtered = train_filtered.drop([(21, 1992), (21, 1995), (38, 1996)], axis
 train_filtered
 
 # We recompute PCA for this new data
-scaler = preprocessing.MinMaxScaler()
-dengue_train = scaler.fit_transform(train_filtered)
+pipeline.fit_features(train_filtered)
+scaler, pca = pipeline.scaler, pipeline.pca
+dengue_train, X_pca = pipeline.transform_features(train_filtered)
 
-pca = PCA ()
-X_pca = pca.fit_transform(dengue_train)
+# The 3 first components, shared by every scatter plot; above MAX_POINTS
+# weeks only a sample of them is drawn
+cloud = PointCloud(X_pca)
 X_pca.shape
 
 """# Clustering by K-means
@@ -358,14 +368,14 @@ random_state = 0
 
 """We are going to choose n depending on the values that the clustering takes in terms of Distortion from n = 2 to n = 11."""
 
-distortions = []
-silhouettes = []
-
-for i in range(2, 13):
-    km = KMeans(i, init, n_init = iterations ,max_iter= max_iter, tol = tol,random_state = random_state)
-    labels = km.fit_predict(X_pca)
-    distortions.append(km.inertia_)
-    silhouettes.append(metrics.silhouette_score(X_pca, labels))
+# Every k is fitted once (n_jobs sets the size of the process pool) and the
+# silhouettes share a single pairwise distance matrix
+km_sweep = stage_cache.run('kmeans', kmeans_sweep, X_pca, range(2, 13),
+                           n_jobs=None, init=init, n_init=iterations,
+                           max_iter=max_iter, tol=tol,
+                           random_state=random_state)
+distortions = km_sweep.distortions
+silhouettes = km_sweep.silhouettes
 
 """We have to choose approximately the higher Silouehette with the lower Distortion."""
 
@@ -392,46 +402,50 @@ plt.show()
 k = 3 #@param { type: "slider", min: 2, max: 7, step: 1}
 
 print ("Number of clusters", k)
-km = KMeans(k, init, n_init = iterations ,
-            max_iter= max_iter, tol = tol, random_state = random_state)
 
-y_km = km.fit_predict(X_pca)
+# The model for k was already fitted in the sweep
+km = km_sweep.model(k)
+y_km = km.labels_
 
-# Commented out IPython magic to ensure Python compatibility.
-from sklearn import metrics
-print("Silhouette Coefficient: %0.3f"
-#       % metrics.silhouette_score(X_pca, y_km))
-      
+print("Silhouette Coefficient: %0.3f" % km_sweep.silhouettes[km_sweep.ks.index(k)])
 print('Distortion: %.2f' % km.inertia_)
 
 """The final values of the algorithm metrics and the visualization from the results(assigned group)."""
 
 km.labels_
 
+"""Before describing the groups, we check that they do not depend on the particular weeks used to find them. K-means is refitted on 100 subsamples of 80% of the weeks, in parallel, and for each group of the model above we measure how well the refits recover it (mean Jaccard similarity, 1 meaning always the same weeks) and how often its weeks end up together."""
+
+km_stability = cluster_stability(X_pca, 'kmeans', k, n_resamples = 100,
+                                 n_jobs = -1, init = init, n_init = iterations,
+                                 max_iter = max_iter, tol = tol)
+print(tabulate(km_stability.table(), floatfmt = ".3f",
+               headers = ("group", "size", "jaccard", "coassociation")))
+
+"""To label new weeks without refitting, the centroids can be handed to a streaming K-means from `dengue.kmeans`: `stream = StreamingKMeans.from_model(km)` updates them with each new batch of projected weeks (`stream.partial_fit_predict(batch)`) and keeps the group ids, so the labels assigned below still apply. `max_drift` bounds how far a centroid may move."""
+
 """And plot the results using the PCA data"""
 
-fig = px.scatter_3d(
-    X_pca[:, :3], x=0, y=1, z=2,
-    color = km.labels_,
-    title='Label Visualization of k-Means Clustering result',
-    labels = {'0':'PCA-1', '1':'PCA-2','2':'PCA-3'}
-)
+fig = cloud.scatter(color = km.labels_,
+                    title='Label Visualization of k-Means Clustering result')
 fig.show()
 
 train_filtered['group'] = km.labels_
 train_filtered
 
-"""After visualization, we should make some representation of the data to assign a label to each group, based on the characteristics of each."""
+"""After visualization, we should make some representation of the data to assign a label to each group, based on the characteristics of each. The mean, deviation and size of every group are computed for all the features at once, and each table below is a selection of columns."""
 
-res = train_filtered[['ndvi_ne', 'ndvi_nw', 'ndvi_se', 'ndvi_sw', 'group']].groupby('group').mean()
+profile = profile_clusters(train_filtered[FEATURE_COLUMNS], train_filtered['group'])
+
+res = profile.mean[['ndvi_ne', 'ndvi_nw', 'ndvi_se', 'ndvi_sw']]
 res.plot(kind='bar', legend=True)
 res
 
-res = train_filtered[['station_precip_mm', 'precipitation_amt_mm', 'reanalysis_precip_amt_kg_per_m2','reanalysis_sat_precip_amt_mm', 'group']].groupby('group').mean()
+res = profile.mean[['station_precip_mm', 'precipitation_amt_mm', 'reanalysis_precip_amt_kg_per_m2','reanalysis_sat_precip_amt_mm']]
 res.plot(kind='bar', legend=True)
 res
 
-res = train_filtered[['station_avg_temp_c', 'station_max_temp_c',	'station_min_temp_c',	'group']].groupby('group').mean()
+res = profile.mean[['station_avg_temp_c', 'station_max_temp_c', 'station_min_temp_c']]
 res.plot(kind='bar', legend=True)
 res
 
@@ -442,22 +456,19 @@ res
 - **Group 2 - High_Precipitation_Vegetation_SlightlyBelow**: High precipitation, relative humidity and northwest's vegetation slightly below average.
 """
 
-def get_group_label(g):
-  if g == 1:
-    return "Standard_Precipitation_Temperatures_Above"
-  elif g == 2:
-    return "High_Precipitation_Vegetation_SlightlyBelow"
-  else :
-    return "Low_Precipitation_Temperatures_SlightlyBelow"
-
-train_filtered['group_label'] = train_filtered['group'].apply(lambda x: get_group_label(x))
-
-fig = px.scatter_3d(
-    X_pca[:, :3], x=0, y=1, z=2,
-    color = train_filtered['group_label'],
-    title='Label Visualization of k-Means Clustering result',
-    labels = {'0':'PCA-1', '1':'PCA-2','2':'PCA-3'}
-)
+group_labels = {
+  0: "Low_Precipitation_Temperatures_SlightlyBelow",
+  1: "Standard_Precipitation_Temperatures_Above",
+  2: "High_Precipitation_Vegetation_SlightlyBelow",
+}
+
+# Groups beyond the three described, when k is raised, take the first name
+train_filtered['group_label'] = label_groups(
+    train_filtered['group'], group_labels,
+    default="Low_Precipitation_Temperatures_SlightlyBelow")
+
+fig = cloud.scatter(color = train_filtered['group_label'],
+                    title='Label Visualization of k-Means Clustering result')
 fig.show()
 
 """# Hierarchical Clustering Algorithm
@@ -465,27 +476,39 @@ fig.show()
 To execute the hierarchical clustering algorithm, we need to compute the similarity matrix. This similarity matrix has been computed previously in 'Outlier identification' section, but we recompute it with the outliers removed from data.
 """
 
-# We define euclidean distance as metric for compute the matrix
-distance = neighbors.DistanceMetric.get_metric('euclidean')
-similarity_matrix = distance.pairwise(dengue_train)
+# We compute the euclidean distance matrix by blocks of rows
+similarity_matrix = DistanceStore(dengue_train)
 
-fig = px.imshow(similarity_matrix)
+fig = distance_heatmap(similarity_matrix)
 fig.show()
 
 """We executed the hierarchical clustering algorithm, testing different cluster_distances_measures and plotting the resulting dendrogram. 
 
-In our opinion, the best solution is to use complete as linkage criterion as we got concentrated data and this criterion allow us to break up big groups. Using this linkage criterion we get a more balanced dendrogram with 2 small groups.
+In our opinion, the best solution is to use complete as linkage criterion as we got concentrated data and this criterion allow us to break up big groups. Using this linkage criterion we got a more balanced dendrogram with 2 small groups when the linkage was computed over the rows of the similarity matrix; the dendrogram below is the one of the real distances between weeks.
 """
 
-cut = 13
+# The linkage is computed on the condensed euclidean distances of the
+# weeks. Passing the square similarity matrix would make scipy take each of
+# its rows as an observation and cluster distances between those rows.
+clusters = stage_cache.run('linkage', linkage_from_features, dengue_train,
+                           method = 'complete')
+
+# Every cut from 2 to 15 groups, labelled from the same linkage and scored
+# against the similarity matrix computed above
+cuts = dendrogram_cuts(clusters, range(2, 16), distances = similarity_matrix)
+print(tabulate(cuts.table(), floatfmt = ".3f",
+               headers = ("cut", "groups", "sizes", "silhouette")))
+
+# We cut the tree where it splits into 5 groups
+n_groups = 5
+cut = (clusters[-n_groups, 2] + clusters[-n_groups + 1, 2]) / 2
 
-clusters = cluster.hierarchy.linkage(similarity_matrix, method = 'complete')
 dendogram = cluster.hierarchy.dendrogram(clusters, color_threshold=cut)
 
 f = plt.figure()
 plt.show()
 
-"""We've decided to cut this dendrogram by 13, so we get a total of 5 groups, 3 big groups and 2 small groups."""
+"""We've decided to cut this dendrogram where it splits into 5 groups. When the linkage was computed over the rows of the similarity matrix these were 3 big groups and 2 small groups, cut at height 13; on the real distances between weeks the heights are much smaller, so the cut is derived from the number of groups, and the sizes of the groups are those of the 5 groups row of the table. The table of cuts above shows the sizes and the silhouette of the alternatives, so another cut is a lookup rather than a new linkage."""
 
 hier_clustering_labels = cluster.hierarchy.fcluster(clusters, cut , criterion = 'distance')
 
@@ -495,14 +518,21 @@ hier_clustering_labels
 
 n_clusters_ = len(set(hier_clustering_labels)) - (1 if -1 in hier_clustering_labels else 0)
 print('Estimated number of clusters: %d' % n_clusters_)
-print("Silhouette Coefficient: %0.3f" % metrics.silhouette_score(dengue_train, hier_clustering_labels))
-
-fig = px.scatter_3d(
-    X_pca[:, :3], x=0, y=1, z=2,
-    color = hier_clustering_labels,
-    title='Data Visualization by PCA with 3 components',
-    labels = {'0':'PCA-1', '1':'PCA-2','2':'PCA-3'}
-)
+# Already scored with the other cuts
+print("Silhouette Coefficient: %0.3f" % cuts.silhouettes[cuts.n_clusters.index(n_groups)])
+
+"""The same check for the cut of the dendrogram: the complete linkage is recomputed on 100 subsamples of the weeks and cut into 5 groups. Groups that come out with a low Jaccard similarity depend on the sample. The consensus labelling groups the weeks that were clustered together in most refits."""
+
+hier_stability = cluster_stability(dengue_train, 'hierarchical', n_groups,
+                                   n_resamples = 100, n_jobs = -1,
+                                   linkage = 'complete')
+print(tabulate(hier_stability.table(), floatfmt = ".3f",
+               headers = ("group", "size", "jaccard", "coassociation")))
+pd.crosstab(hier_clustering_labels, hier_stability.consensus(),
+            rownames = ["group"], colnames = ["consensus"])
+
+fig = cloud.scatter(color = hier_clustering_labels,
+                    title='Data Visualization by PCA with 3 components')
 fig.show()
 
 """Now we've got the best dendrogram/cut in our opinion, we have to characterize the obtained groups. 
@@ -515,25 +545,29 @@ train_filtered['group'] = hier_clustering_labels
 
 train_filtered.describe()
 
-res = train_filtered[['ndvi_ne', 'ndvi_nw', 'ndvi_se', 'ndvi_sw', 'group']].groupby('group').mean()
-res.plot(kind='bar', legend=True, ylim = [0.075,0.210])
+profile = profile_clusters(train_filtered[FEATURE_COLUMNS], train_filtered['group'])
+
+"""The bars show how far the mean of every group is from the mean of all the weeks, so they need no fixed axis limits whatever groups the cut gives."""
 
-res = train_filtered[['reanalysis_air_temp_k', 'reanalysis_avg_temp_k', 'reanalysis_dew_point_temp_k', 'reanalysis_max_air_temp_k', 'reanalysis_min_air_temp_k', 'station_avg_temp_c', 'group']].groupby('group').mean()
+res = profile.deviation[['ndvi_ne', 'ndvi_nw', 'ndvi_se', 'ndvi_sw']]
+res.plot(kind='bar', legend=True)
+
+res = profile.mean[['reanalysis_air_temp_k', 'reanalysis_avg_temp_k', 'reanalysis_dew_point_temp_k', 'reanalysis_max_air_temp_k', 'reanalysis_min_air_temp_k', 'station_avg_temp_c']]
 res
 
-res = train_filtered[['reanalysis_air_temp_k', 'reanalysis_avg_temp_k', 'reanalysis_dew_point_temp_k', 'reanalysis_max_air_temp_k', 'reanalysis_min_air_temp_k', 'group']].groupby('group').mean()
-res.plot(kind='bar', legend=True, ylim = [290,305])
+res = profile.deviation[['reanalysis_air_temp_k', 'reanalysis_avg_temp_k', 'reanalysis_dew_point_temp_k', 'reanalysis_max_air_temp_k', 'reanalysis_min_air_temp_k']]
+res.plot(kind='bar', legend=True)
 
-res = train_filtered[['precipitation_amt_mm', 'reanalysis_precip_amt_kg_per_m2', 'reanalysis_sat_precip_amt_mm', 'station_precip_mm', 'group']].groupby('group').mean()
+res = profile.deviation[['precipitation_amt_mm', 'reanalysis_precip_amt_kg_per_m2', 'reanalysis_sat_precip_amt_mm', 'station_precip_mm']]
 res.plot(kind='bar', legend=True)
 
-res = train_filtered[['reanalysis_relative_humidity_percent', 'group']].groupby('group').mean()
-res.plot(kind='bar', legend=True, ylim=[70, 90])
+res = profile.deviation[['reanalysis_relative_humidity_percent']]
+res.plot(kind='bar', legend=True)
 
-res = train_filtered[['reanalysis_tdtr_k', 'group']].groupby('group').mean()
+res = profile.deviation[['reanalysis_tdtr_k']]
 res.plot(kind='bar', legend=True)
 
-"""We assigned the following descriptions/labels to the different groups:
+"""These were the descriptions/labels we assigned to the groups of the previous clustering, the linkage over the rows of the similarity matrix. The groups of the cut above are numbered by `fcluster` from left to right in the dendrogram and have other sizes, so the numbers below do not name the same weeks, and the groups are not named here until they are described again from the bars above.
 
 - **Group 1 - Low_Precipitation_Temperatures_Below**: Vegetation on the west above average, very low precipitation and temperatures below average.
 - **Group 2 - Standard_Precipitation_Temperatures_Above**: Temperatures above average and standard precipitation. 
@@ -542,26 +576,24 @@ res.plot(kind='bar', legend=True)
 - **Group 5 - Low_Precipitation_RelativeHumidity_Below**: Low precipitation and relative humidity below average.
 """
 
-def get_group_label(g):
-  if g == 1:
-    return "Low_Precipitation_Temperatures_Below"
-  elif g == 2:
-    return "Standard_Precipitation_Temperatures_Above"
-  elif g == 3:
-    return "Standard_Precipitation_Temperatures_ThermalAmplitude_Below"
-  elif g == 4:
-    return "High_Precipitation_RelativeHumidity"
-  else:
-    return "Low_Precipitation_RelativeHumidity_Below"
-
-train_filtered['group_label'] = train_filtered['group'].apply(lambda x: get_group_label(x))
-
-"""Plot the graphical result of the clustering, with the labels assigned to the groups."""
-
-fig = px.scatter_3d(
-    X_pca[:, :3], x=0, y=1, z=2,
-    color = train_filtered['group_label'],
-    title='Label Visualization of Hierarchical Clustering result',
-    labels = {'0':'PCA-1', '1':'PCA-2','2':'PCA-3'}
-)
-fig.show()
\ No newline at end of file
+"""Plot the graphical result of the clustering, with the number of every group."""
+
+fig = cloud.scatter(color = hier_clustering_labels.astype(str),
+                    title='Groups of the Hierarchical Clustering result')
+fig.show()
+
+"""# Other cities
+
+The same analysis (filter, scale, PCA, DBSCAN outliers and K-means with 3 groups) is run for every city of the dataset, here by windows of 5 years. The imputed features are shared with the worker processes through shared memory, and each city or window is analyzed in parallel. The report shows the number of weeks, outliers and groups of each task and the seconds spent in each stage. `city_labels[('iq', 2000, 2004)]` holds the groups of the weeks of one task."""
+
+city_report, city_labels = run_cities(train, width = 5, eps = 0.65,
+                                      min_samples = minPts, k = 3,
+                                      drop_outliers = True)
+print(tabulate(city_report, headers = REPORT_HEADERS, floatfmt = ".3f"))
+
+"""# Stage timings
+
+Time spent in each stage of the analysis (calls, wall seconds, CPU seconds). Every span also records the peak memory of the process and the size of its input and output arrays; `trace.TRACER.write('trace.json')` saves them in a format Perfetto or chrome://tracing can open.
+"""
+
+print(tabulate(trace.TRACER.summary(), headers = ("stage", "calls", "wall", "cpu")))
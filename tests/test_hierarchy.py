@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from scipy.cluster import hierarchy
+from sklearn.metrics import silhouette_score
+
+from dengue.distances import DistanceStore
+from dengue.hierarchy import dendrogram_cuts, merge_labels
+
+
+@pytest.mark.parametrize('method', ['complete', 'average', 'single', 'ward'])
+@pytest.mark.parametrize('seed', range(5))
+def test_merge_labels_match_fcluster(method, seed):
+  X = np.random.RandomState(seed).rand(150, 3)
+  clusters = hierarchy.linkage(X, method)
+  labels = merge_labels(clusters, range(1, 20))
+  for k in range(1, 20):
+    np.testing.assert_array_equal(
+        labels[k], hierarchy.fcluster(clusters, k, criterion='maxclust'))
+
+
+def test_cuts_match_fcluster_and_silhouette():
+  X = np.random.RandomState(0).rand(300, 4)
+  clusters = hierarchy.linkage(X, 'complete')
+  cuts = dendrogram_cuts(clusters, range(2, 12),
+                         distances=DistanceStore(X, block_rows=64))
+  for cut, k, silhouette in zip(cuts.cuts, cuts.n_clusters, cuts.silhouettes):
+    expected = hierarchy.fcluster(clusters, k, criterion='maxclust')
+    np.testing.assert_array_equal(cuts.labels(k), expected)
+    np.testing.assert_array_equal(
+        hierarchy.fcluster(clusters, cut, criterion='distance'), expected)
+    assert silhouette == pytest.approx(silhouette_score(X, expected))
+
+
+def test_cuts_by_height():
+  X = np.random.RandomState(1).rand(100, 3)
+  clusters = hierarchy.linkage(X, 'average')
+  heights = [0.2, 0.3, 0.5]
+  cuts = dendrogram_cuts(clusters, heights=heights)
+  for height, k in zip(heights, cuts.n_clusters):
+    np.testing.assert_array_equal(
+        cuts.labels(k), hierarchy.fcluster(clusters, height, criterion='distance'))
+
+
+def test_cuts_out_of_range():
+  X = np.random.RandomState(0).rand(50, 2)
+  clusters = hierarchy.linkage(X, 'complete')
+  with pytest.raises(ValueError, match='60'):
+    dendrogram_cuts(clusters, [2, 60], distances=X)
+  with pytest.raises(ValueError):
+    dendrogram_cuts(clusters, [0, 2])
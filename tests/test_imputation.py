@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.impute import KNNImputer
+
+from dengue.imputation import compare_imputers, impute, mask_values
+from dengue.synthetic import synthetic_features
+
+
+def _frame(n_rows, n_features=4, seed=0):
+  rng = np.random.RandomState(seed)
+  index = pd.MultiIndex.from_arrays(
+      [np.repeat('sj', n_rows), 1990 + np.arange(n_rows) // 52,
+       1 + np.arange(n_rows) % 52], names=['city', 'year', 'weekofyear'])
+  return pd.DataFrame(rng.normal(size=(n_rows, n_features)), index=index,
+                      columns=['f%d' % i for i in range(n_features)])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_knn_matches_knn_imputer(seed):
+  # Gaps in one column only: the donors of KNNImputer are then the complete
+  # rows, and with few of them every one is a candidate
+  df = _frame(20, seed=seed)
+  rng = np.random.RandomState(seed)
+  df.iloc[rng.choice(20, 4, replace=False), 2] = np.nan
+  expected = KNNImputer(n_neighbors=5).fit_transform(df)
+  np.testing.assert_allclose(impute(df, 'knn').to_numpy(), expected)
+  np.testing.assert_allclose(impute(df, 'knn_exact').to_numpy(), expected)
+
+
+def test_knn_error_close_to_knn_imputer():
+  df = synthetic_features(3000)
+  results = dict((method, rmse) for method, _, rmse
+                 in compare_imputers(df, methods=('knn', 'knn_exact')))
+  assert results['knn'] < 1.15 * results['knn_exact']
+
+
+@pytest.mark.parametrize('method', ['knn', 'knn_exact'])
+def test_knn_with_an_empty_column(method):
+  df = _frame(500)
+  df.iloc[:, 0] = np.nan
+  df.iloc[::3, 1] = np.nan
+  filled = impute(df, method)
+  assert not filled.isna().any().any()
+  np.testing.assert_array_equal(filled.iloc[:, 0], 0)
+
+
+def test_knn_empty_column_in_one_city():
+  df = synthetic_features(2000, years_per_city=20)
+  masked, _ = mask_values(df, 0.05)
+  cities = masked.index.get_level_values('city')
+  masked.loc[cities == 'iq', 'ndvi_ne'] = np.nan
+  for method in ('knn', 'knn_exact'):
+    filled = impute(masked, method)
+    assert not filled.isna().any().any()
+    iq = filled.loc[cities == 'iq', 'ndvi_ne']
+    assert np.allclose(iq, masked.loc[cities == 'sj', 'ndvi_ne'].mean())
+
+
+def test_knn_without_complete_rows():
+  df = _frame(60)
+  for column in range(4):
+    df.iloc[column::4, column] = np.nan
+  filled = impute(df, 'knn')
+  expected = KNNImputer(n_neighbors=5).fit_transform(df)
+  np.testing.assert_allclose(filled.to_numpy(), expected)
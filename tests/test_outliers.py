@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+from sklearn.datasets import make_blobs
+
+from dengue.outliers import DBSCANSweep, OutlierModel, dbscan_sweep
+
+EPS_VALUES = [0.3, 0.45, 0.6, 0.75, 0.9]
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_sweep_matches_dbscan(seed):
+  rng = np.random.RandomState(seed)
+  X, _ = make_blobs(rng.randint(50, 400), n_features=rng.randint(2, 6),
+                    centers=rng.randint(1, 6), cluster_std=rng.uniform(0.3, 1.5),
+                    random_state=seed)
+  min_samples = rng.randint(2, 10)
+  results, labels = dbscan_sweep(X, EPS_VALUES, min_samples=min_samples)
+  for (eps, n_clusters, n_outliers) in results:
+    expected = DBSCAN(eps=eps, min_samples=min_samples).fit(X).labels_
+    np.testing.assert_array_equal(labels[eps], expected)
+    assert n_clusters == len(set(expected) - {-1})
+    assert n_outliers == np.count_nonzero(expected == -1)
+
+
+def test_labels_in_any_order():
+  X, _ = make_blobs(300, centers=4, random_state=0)
+  sweep = DBSCANSweep(X, 1.0, min_samples=6)
+  for eps in [0.9, 0.4, 1.0, 0.4, 0.6]:
+    expected = DBSCAN(eps=eps, min_samples=6).fit(X).labels_
+    np.testing.assert_array_equal(sweep.labels(eps), expected)
+
+
+def test_eps_above_maximum():
+  sweep = DBSCANSweep(np.random.RandomState(0).rand(20, 2), 0.5)
+  with pytest.raises(ValueError):
+    sweep.labels(0.6)
+
+
+def test_outlier_model_flags_noise():
+  X, _ = make_blobs(400, centers=3, cluster_std=1.5, random_state=1)
+  sweep = DBSCANSweep(X, 0.8, min_samples=6)
+  model = sweep.outlier_model(0.8)
+  np.testing.assert_array_equal(model.is_outlier(X), sweep.labels(0.8) == -1)
+  fitted = DBSCAN(eps=0.8, min_samples=6).fit(X)
+  Y = np.random.RandomState(2).uniform(X.min(), X.max(), (200, 2))
+  np.testing.assert_array_equal(model.predict(Y),
+                                OutlierModel.from_dbscan(fitted).predict(Y))
+
+
+@pytest.mark.parametrize('metric', ['manhattan', 'chebyshev'])
+def test_other_metrics(metric):
+  X, _ = make_blobs(200, centers=3, random_state=3)
+  sweep = DBSCANSweep(X, 1.5, min_samples=4, metric=metric)
+  for eps in [0.5, 1.0, 1.5]:
+    expected = DBSCAN(eps=eps, min_samples=4, metric=metric).fit(X).labels_
+    np.testing.assert_array_equal(sweep.labels(eps), expected)
+
+
+@pytest.mark.parametrize('min_samples', [1, 2, 500])
+def test_small_min_samples_and_tiny_data(min_samples):
+  X, _ = make_blobs(40, centers=2, random_state=4)
+  sweep = DBSCANSweep(X, 1.0, min_samples=min_samples)
+  expected = DBSCAN(eps=1.0, min_samples=min_samples).fit(X).labels_
+  np.testing.assert_array_equal(sweep.labels(1.0), expected)
+
+
+def test_duplicate_points():
+  # Zero distances between core points are edges of the tree too
+  X, _ = make_blobs(200, centers=3, random_state=1)
+  X = np.vstack([X, X[:50], np.repeat(X[:1], 10, axis=0)])
+  results, labels = dbscan_sweep(X, EPS_VALUES, min_samples=4)
+  for eps in EPS_VALUES:
+    expected = DBSCAN(eps=eps, min_samples=4).fit(X).labels_
+    np.testing.assert_array_equal(labels[eps], expected)
+
+
+def test_sparse_data_mostly_noise():
+  X = np.random.RandomState(0).uniform(size=(2000, 10))
+  results, labels = dbscan_sweep(X, [0.5, 0.6, 0.7], min_samples=6)
+  for eps in (0.5, 0.6, 0.7):
+    expected = DBSCAN(eps=eps, min_samples=6).fit(X).labels_
+    np.testing.assert_array_equal(labels[eps], expected)